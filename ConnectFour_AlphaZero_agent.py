@@ -2,122 +2,647 @@ import numpy as np
 import torch
 import torch.nn as nn
 import torch.nn.functional as F
-from tqdm.notebook import trange
 import math
 import time
+from collections import OrderedDict
 
 torch.manual_seed(time.time_ns())
 
 
-class Node:
-    def __init__(self, game, args, state, parent=None, action_taken=None, prior=0, visit_count=0):
+class SearchTree:
+    def __init__(self, game, args, capacity):
         self.game = game
         self.args = args
-        self.state = state
-        self.parent = parent
-        self.action_taken = action_taken
-        self.prior = prior
+        self.capacity = 0
+        self.size = 0
         
-        self.children = []
+        self.visit_count = np.zeros(0, dtype=np.int32)
+        self.value_sum = np.zeros(0, dtype=np.float64)
+        self.prior = np.zeros(0, dtype=np.float32)
+        self.first_child = np.zeros(0, dtype=np.int32)
+        self.child_count = np.zeros(0, dtype=np.int8)
+        self.action_taken = np.zeros(0, dtype=np.int8)
+        self.parent = np.zeros(0, dtype=np.int32)
+        self.q_value = np.zeros(0, dtype=np.float64)
+        # Network planes of every expanded node, so a child's leaf encoding
+        # is its parent's with one move applied. Only expanded nodes get a
+        # slot, and the planes are 0/1 so uint8 keeps the pool small.
+        self.encoded_slot = np.zeros(0, dtype=np.int32)
+        self.encoded_states = np.zeros((0, 3, game.row_count, game.column_count), dtype=np.uint8)
+        self.encoded_count = 0
+        self.root_state = None
+        self._alternating = np.where(np.arange(game.row_count * game.column_count + 1) % 2 == 0, 1.0, -1.0)
+        self._grow(capacity)
         
-        self.visit_count = visit_count
-        self.value_sum = 0
+    def _grow(self, capacity):
+        def resized(array):
+            grown = np.zeros(capacity, dtype=array.dtype)
+            grown[:self.size] = array[:self.size]
+            return grown
         
-    def is_fully_expanded(self):
-        return len(self.children) > 0
-    
-    def select(self):
-        best_child = None
-        best_ucb = -np.inf
+        self.visit_count = resized(self.visit_count)
+        self.value_sum = resized(self.value_sum)
+        self.prior = resized(self.prior)
+        self.first_child = resized(self.first_child)
+        self.child_count = resized(self.child_count)
+        self.action_taken = resized(self.action_taken)
+        self.parent = resized(self.parent)
+        self.q_value = resized(self.q_value)
+        self.encoded_slot = resized(self.encoded_slot)
+        self.capacity = capacity
+        
+    def add_root(self, state):
+        # Only the root keeps a board; every other node is reached by
+        # replaying the actions on its path, see get_child_state.
+        self.size = 0
+        self.encoded_count = 0
+        self.root_state = state.copy()
+        return self._add_node(parent=-1, action_taken=-1, prior=0, visit_count=1)
         
-        for child in self.children:
-            ucb = self.get_ucb(child)
-            if ucb > best_ucb:
-                best_child = child
-                best_ucb = ucb
+    def _add_node(self, parent, action_taken, prior, visit_count=0):
+        if self.size == self.capacity:
+            self._grow(2 * self.capacity)
+        node = self.size
+        self.visit_count[node] = visit_count
+        self.value_sum[node] = 0
+        self.prior[node] = prior
+        self.first_child[node] = -1
+        self.child_count[node] = 0
+        self.action_taken[node] = action_taken
+        self.parent[node] = parent
+        self.q_value[node] = 0
+        self.encoded_slot[node] = -1
+        self.size += 1
+        return node
+    
+    def get_child(self, node, action):
+        first = self.first_child[node]
+        children = self.action_taken[first:first + self.child_count[node]]
+        match = np.flatnonzero(children == action)
+        return first + int(match[0]) if len(match) > 0 else None
+    
+    def get_child_state(self, state, child):
+        child_state = self.game.get_next_state(state.copy(), self.action_taken[child], 1)
+        return self.game.change_perspective(child_state, player=-1)
+    
+    def get_encoded_state(self, node):
+        slot = self.encoded_slot[node]
+        return self.encoded_states[slot] if slot >= 0 else None
+    
+    def set_encoded_state(self, node, encoded_state):
+        slot = self.encoded_slot[node]
+        if slot < 0:
+            if self.encoded_count == len(self.encoded_states):
+                grown = np.zeros((max(2 * self.encoded_count, 64),) + self.encoded_states.shape[1:], dtype=np.uint8)
+                grown[:self.encoded_count] = self.encoded_states[:self.encoded_count]
+                self.encoded_states = grown
+            slot = self.encoded_count
+            self.encoded_slot[node] = slot
+            self.encoded_count += 1
+        self.encoded_states[slot] = encoded_state
+    
+    def get_state(self, node):
+        path = []
+        while node != 0:
+            path.append(node)
+            node = self.parent[node]
+        state = self.root_state
+        for node in reversed(path):
+            state = self.get_child_state(state, node)
+        return state
+    
+    def reroot(self, node):
+        root_state = self.get_state(node)
+        # Copy the subtree below node to the front of the arrays, breadth
+        # first, so siblings stay contiguous and the rest is discarded.
+        nodes = [node]
+        first_child = []
+        for old_node in nodes:
+            if self.child_count[old_node] > 0:
+                first_child.append(len(nodes))
+                first = self.first_child[old_node]
+                nodes.extend(range(first, first + self.child_count[old_node]))
+            else:
+                first_child.append(-1)
                 
-        return best_child
+        nodes = np.array(nodes)
+        new_index = np.full(self.size, -1, dtype=np.int32)
+        new_index[nodes] = np.arange(len(nodes))
+        
+        self.visit_count[:len(nodes)] = self.visit_count[nodes]
+        self.value_sum[:len(nodes)] = self.value_sum[nodes]
+        self.prior[:len(nodes)] = self.prior[nodes]
+        self.child_count[:len(nodes)] = self.child_count[nodes]
+        self.action_taken[:len(nodes)] = self.action_taken[nodes]
+        self.q_value[:len(nodes)] = self.q_value[nodes]
+        self.parent[:len(nodes)] = new_index[self.parent[nodes]]
+        self.first_child[:len(nodes)] = first_child
+        slots = self.encoded_slot[nodes]
+        kept = slots >= 0
+        self.encoded_states[:np.count_nonzero(kept)] = self.encoded_states[slots[kept]]
+        self.encoded_count = int(np.count_nonzero(kept))
+        self.encoded_slot[:len(nodes)] = -1
+        self.encoded_slot[:len(nodes)][kept] = np.arange(self.encoded_count)
+        self.parent[0] = -1
+        self.action_taken[0] = -1
+        self.root_state = root_state
+        self.size = len(nodes)
+        return 0
     
-    def get_ucb(self, child):
-        if child.visit_count == 0:
-            q_value = 0
-        else:
-            q_value = 1 - ((child.value_sum / child.visit_count) + 1) / 2
-        return q_value + self.args['C'] * (math.sqrt(self.visit_count) / (child.visit_count + 1)) * child.prior
-    
-    def expand(self, policy):
-        for action, prob in enumerate(policy):
-            if prob > 0:
-                child_state = self.state.copy()
-                child_state = self.game.get_next_state(child_state, action, 1)
-                child_state = self.game.change_perspective(child_state, player=-1)
+    def is_decided(self, node, remaining):
+        # True once the most visited child cannot be caught up within
+        # `remaining` more simulations.
+        if self.child_count[node] < 2:
+            return True
+        first = self.first_child[node]
+        visit_count = self.visit_count[first:first + self.child_count[node]]
+        second, best = np.partition(visit_count, -2)[-2:]
+        return best - second > remaining
+    
+    def add_exploration_noise(self, node, epsilon, alpha):
+        first = self.first_child[node]
+        children = slice(first, first + self.child_count[node])
+        noise = np.random.dirichlet([alpha] * self.child_count[node])
+        self.prior[children] = (1 - epsilon) * self.prior[children] + epsilon * noise
+    
+    def get_action_taken(self, node):
+        action = int(self.action_taken[node])
+        return action if action >= 0 else None
+        
+    def is_fully_expanded(self, node):
+        return self.child_count[node] > 0
+    
+    def select(self, node):
+        first = self.first_child[node]
+        children = slice(first, first + self.child_count[node])
+        
+        ucb = (self.args['C'] * math.sqrt(self.visit_count[node])) * self.prior[children] / (self.visit_count[children] + 1)
+        ucb += self.q_value[children]
+        return first + int(ucb.argmax())
+    
+    def expand(self, node, policy, encoded_state=None):
+        if encoded_state is not None:
+            self.set_encoded_state(node, encoded_state)
+        actions = np.flatnonzero(policy > 0)
+        if self.size + len(actions) > self.capacity:
+            self._grow(max(2 * self.capacity, self.size + len(actions)))
+            
+        self.first_child[node] = self.size
+        self.child_count[node] = len(actions)
+        for action in actions:
+            self._add_node(node, action, policy[action])
+            
+    def backpropagate(self, path, value):
+        # path runs from the root down to the evaluated node, whose value is
+        # taken from its own perspective, so the sign flips every ply upwards.
+        path = np.asarray(path)
+        self._update(path, value * self._alternating[len(path) - 1::-1], 1)
+            
+    def apply_virtual_loss(self, path, virtual_loss):
+        self._update(np.asarray(path), virtual_loss, virtual_loss)
+        
+    def _update(self, path, value, visits):
+        self.value_sum[path] += value
+        self.visit_count[path] += visits
+        
+        # q_value is the child's score seen from its parent, cached so that
+        # select only has to add the exploration term.
+        visit_count = self.visit_count[path]
+        self.q_value[path] = np.where(
+            visit_count > 0, 1 - ((self.value_sum[path] / np.maximum(visit_count, 1)) + 1) / 2, 0
+        )
+            
+    def get_visit_counts(self, node):
+        first = self.first_child[node]
+        children = slice(first, first + self.child_count[node])
+        visit_counts = np.zeros(self.game.action_size)
+        visit_counts[self.action_taken[children]] = self.visit_count[children]
+        return visit_counts
+            
+    def get_action_probs(self, node):
+        first = self.first_child[node]
+        children = slice(first, first + self.child_count[node])
+        action_probs = self.get_visit_counts(node)
+        if np.sum(action_probs) == 0:
+            # Stopped before any simulation finished: fall back to the priors.
+            action_probs[self.action_taken[children]] = self.prior[children]
+        action_probs /= np.sum(action_probs)
+        return action_probs
 
-                child = Node(self.game, self.args, child_state, self, action, prob)
-                self.children.append(child)
-                
-        return child
+class EvaluationCache:
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        
+    def __len__(self):
+        return len(self.entries)
+        
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return entry
+    
+    def put(self, key, policy_logits, value):
+        self.entries[key] = (policy_logits, value)
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.capacity:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+            
+    def clear(self):
+        self.entries.clear()
             
-    def backpropagate(self, value):
-        self.value_sum += value
-        self.visit_count += 1
+    def get_stats(self):
+        return {
+            'size': len(self.entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions
+        }
+
+class SearchStats:
+    # Per-phase timers and counters of one search. Selection covers the
+    # descent only; encoding the leaves is part of inference, and applying
+    # or removing virtual loss is part of backpropagation.
+    def __init__(self):
+        self.simulations = 0
+        self.nodes_created = 0
+        self.max_depth = 0
+        self.total_depth = 0
+        self.terminal_leaves = 0
+        self.solver_leaves = 0
+        self.cache_hits = 0
+        self.inference_calls = 0
+        self.inference_positions = 0
+        self.selection_time = 0.0
+        self.expansion_time = 0.0
+        self.inference_time = 0.0
+        self.backpropagation_time = 0.0
+        self.total_time = 0.0
+        
+    def get_stats(self):
+        return {
+            'simulations': self.simulations,
+            'nodes_created': self.nodes_created,
+            'max_depth': self.max_depth,
+            'mean_depth': self.total_depth / self.simulations if self.simulations > 0 else 0.0,
+            'terminal_leaves': self.terminal_leaves,
+            'solver_leaves': self.solver_leaves,
+            'cache_hits': self.cache_hits,
+            'inference_calls': self.inference_calls,
+            'inference_positions': self.inference_positions,
+            'selection_time': self.selection_time,
+            'expansion_time': self.expansion_time,
+            'inference_time': self.inference_time,
+            'backpropagation_time': self.backpropagation_time,
+            'total_time': self.total_time,
+            'simulations_per_sec': self.simulations / self.total_time if self.total_time > 0 else 0.0
+        }
         
-        value = self.game.get_opponent_value(value)
-        if self.parent is not None:
-            self.parent.backpropagate(value)  
+    def __str__(self):
+        total_time = max(self.total_time, 1e-9)
+        return (
+            f"{self.simulations} simulations in {self.total_time * 1000:.1f} ms "
+            f"({self.simulations / total_time:.0f}/s), {self.nodes_created} nodes, depth {self.max_depth}, "
+            f"{self.inference_calls} inference calls ({self.inference_positions} positions), "
+            f"{self.cache_hits} cache hits; selection {self.selection_time / total_time:.0%}, "
+            f"expansion {self.expansion_time / total_time:.0%}, inference {self.inference_time / total_time:.0%}, "
+            f"backpropagation {self.backpropagation_time / total_time:.0%}"
+        )
 
 class MCTS:
-    def __init__(self, game, args, model):
+    def __init__(self, game, args, model, cache=None, solver=None):
         self.game = game
         self.args = args
         self.model = model
+        self.cache = cache
+        self.solver = solver
+        self.tree = SearchTree(game, args, args['num_searches'] * game.action_size + 1)
+        self.root = None
+        # Filled in by search() when args['collect_stats'] is set, and passed
+        # to stats_callback once the search is over.
+        self.stats = None
+        self.stats_callback = None
+        self.input_tensor = None
+        self.input_buffer = None
+        self._reserve_input(args.get('batch_size', 1))
         
-    @torch.no_grad()
-    def search(self, state):
-        root = Node(self.game, self.args, state, visit_count=1)
-        
-        policy, _ = self.model(
-            torch.tensor(self.game.get_encoded_state(state), device=self.model.device).unsqueeze(0)
+    def _reserve_input(self, count):
+        # select_leaves writes leaf planes straight into this buffer, which
+        # the model then reads without another copy. It is pinned when the
+        # model is on a GPU so the copy to the device can run asynchronously.
+        if self.input_buffer is not None and len(self.input_buffer) >= count:
+            return
+        device = getattr(self.model, 'device', None)
+        self.input_tensor = torch.empty(
+            (count, 3, self.game.row_count, self.game.column_count),
+            dtype=torch.float32,
+            pin_memory=device is not None and device.type == "cuda"
         )
-        policy = torch.softmax(policy, axis=1).squeeze(0).cpu().numpy()
-        policy = (1 - self.args['dirichlet_epsilon']) * policy + self.args['dirichlet_epsilon'] \
-            * np.random.dirichlet([self.args['dirichlet_alpha']] * self.game.action_size)
+        self.input_buffer = self.input_tensor.numpy()
+        
+    def reset(self):
+        self.root = None
         
-        valid_moves = self.game.get_valid_moves(state)
-        policy *= valid_moves
+    def advance(self, action):
+        # Keep the subtree below the move that was actually played so the
+        # next search starts from its statistics.
+        if self.root is None:
+            return
+        child = self.tree.get_child(self.root, action)
+        if child is None:
+            self.root = None
+        else:
+            self.root = self.tree.reroot(child)
+        
+    def _run_model(self, count):
+        # Evaluates the first count rows of the input buffer.
+        stats = self.stats
+        if stats is not None:
+            start_time = time.perf_counter()
+        encoded_states = self.input_tensor[:count]
+        if self.model.device.type != "cpu":
+            encoded_states = encoded_states.to(self.model.device, non_blocking=True)
+        policy_logits, values = self.model(encoded_states)
+        policy_logits, values = policy_logits.cpu().numpy(), values.squeeze(1).cpu().numpy()
+        if stats is not None:
+            stats.inference_time += time.perf_counter() - start_time
+            stats.inference_calls += 1
+            stats.inference_positions += count
+        return policy_logits, values
+    
+    def _encode_leaf(self, path, state, out):
+        parent_encoded_state = self.tree.get_encoded_state(path[-2]) if len(path) > 1 else None
+        if parent_encoded_state is None:
+            return self.game.get_encoded_state(state, out)
+        return self.game.get_next_encoded_state(parent_encoded_state, state, self.tree.action_taken[path[-1]], out)
+    
+    def _lookup(self, state):
+        if self.cache is None:
+            return None
+        return self.cache.get(state.key)
+    
+    def _store(self, state, policy_logits, value):
+        if self.cache is not None:
+            self.cache.put(state.key, policy_logits.copy(), value)
+            
+    def _get_policy(self, policy_logits):
+        policy = np.exp(policy_logits - np.max(policy_logits))
+        return policy / np.sum(policy)
+    
+    def _expand(self, node, state, policy_logits, encoded_state=None):
+        stats = self.stats
+        if stats is not None:
+            start_time = time.perf_counter()
+            size = self.tree.size
+        policy = self._get_policy(policy_logits)
+        if node == self.root:
+            policy = (1 - self.args['dirichlet_epsilon']) * policy + self.args['dirichlet_epsilon'] \
+                * np.random.dirichlet([self.args['dirichlet_alpha']] * self.game.action_size)
+        policy *= self.game.get_valid_moves(state)
         policy /= np.sum(policy)
-        root.expand(policy)
+        self.tree.expand(node, policy, encoded_state)
+        if stats is not None:
+            stats.expansion_time += time.perf_counter() - start_time
+            stats.nodes_created += self.tree.size - size
+        
+    def _backpropagate(self, path, value=None, virtual_loss=None):
+        # Backs up a value, or applies virtual loss when one is given.
+        stats = self.stats
+        if stats is not None:
+            start_time = time.perf_counter()
+        if virtual_loss is None:
+            self.tree.backpropagate(path, value)
+        else:
+            self.tree.apply_virtual_loss(path, virtual_loss)
+        if stats is not None:
+            stats.backpropagation_time += time.perf_counter() - start_time
+        
+    @torch.no_grad()
+    def search(self, state, num_searches=None, time_limit=None, should_stop=None):
+        if num_searches is None:
+            num_searches = self.args['num_searches']
+        if time_limit is None:
+            time_limit = self.args.get('time_limit')
+            
+        self.stats = SearchStats() if self.args.get('collect_stats', False) else None
+        start_time = time.perf_counter()
+        root = self.set_root(state)
+        self._expand_root()
+        # Visits already in a reused subtree count towards num_searches.
+        self._simulate(
+            root,
+            num_searches - (self.tree.visit_count[root] - 1),
+            should_stop,
+            time_limit,
+            self.args.get('early_stopping', False)
+        )
+        if self.stats is not None:
+            self.stats.total_time = time.perf_counter() - start_time
+            if self.stats_callback is not None:
+                self.stats_callback(self.stats)
+        return self.tree.get_action_probs(root)
+    
+    @torch.no_grad()
+    def ponder(self, state, should_stop):
+        # Grows the tree for a position where the other side is to move until
+        # should_stop() returns True; advance() then keeps the subtree of the
+        # move actually played.
+        self.stats = None
+        root = self.set_root(state)
+        self._expand_root()
+        self._simulate(root, self.args['max_ponder_searches'] - (self.tree.visit_count[root] - 1), should_stop)
+        
+    def set_root(self, state):
+        tree = self.tree
+        if self.root is not None and tree.root_state == state:
+            if tree.is_fully_expanded(self.root) and self.args['dirichlet_epsilon'] > 0:
+                tree.add_exploration_noise(self.root, self.args['dirichlet_epsilon'], self.args['dirichlet_alpha'])
+        else:
+            self.root = tree.add_root(state)
+        return self.root
+    
+    def _expand_root(self):
+        if self.tree.is_fully_expanded(self.root):
+            return
+        leaves, _ = self.select_leaves(1)
+        if len(leaves) > 0:
+            self.backup_leaves(leaves, *self._run_model(len(leaves)))
+    
+    def select_leaves(self, count):
+        # Runs up to `count` selections from the root. Terminal and cached
+        # leaves are backed up straight away; the rest are returned as
+        # (path, state) pairs, under virtual loss, for backup_leaves once the
+        # caller has evaluated them. Leaves the solver can reach are scored
+        # exactly instead. An unexpanded root is returned on its own
+        # and does not count as a simulation. The planes of the returned
+        # leaves are in input_buffer, in order, until the next call.
+        tree = self.tree
+        root = self.root
+        virtual_loss = self.args.get('virtual_loss', 1)
+        self._reserve_input(max(count, 1))
+        
+        if not tree.is_fully_expanded(root):
+            encoded_state = self.game.get_encoded_state(tree.root_state, self.input_buffer[0])
+            evaluation = self._lookup(tree.root_state)
+            if evaluation is None:
+                return [([root], tree.root_state)], 0
+            self._expand(root, tree.root_state, evaluation[0], encoded_state)
         
-        for search in range(self.args['num_searches']):
+        stats = self.stats
+        leaves = []
+        for _ in range(count):
+            if stats is not None:
+                start_time = time.perf_counter()
             node = root
+            path = [root]
+            state = tree.root_state
             
-            while node.is_fully_expanded():
-                node = node.select()
+            while tree.is_fully_expanded(node):
+                node = tree.select(node)
+                path.append(node)
+                state = tree.get_child_state(state, node)
                 
-            value, is_terminal = self.game.get_value_and_terminated(node.state, node.action_taken)
+            value, is_terminal = self.game.get_value_and_terminated(state, tree.get_action_taken(node))
             value = self.game.get_opponent_value(value)
+            if stats is not None:
+                stats.selection_time += time.perf_counter() - start_time
+                stats.simulations += 1
+                stats.total_depth += len(path) - 1
+                stats.max_depth = max(stats.max_depth, len(path) - 1)
             
-            if not is_terminal:
-                policy, value = self.model(
-                    torch.tensor(self.game.get_encoded_state(node.state), device=self.model.device).unsqueeze(0)
-                )
-                policy = torch.softmax(policy, axis=1).squeeze(0).cpu().numpy()
-                valid_moves = self.game.get_valid_moves(node.state)
-                policy *= valid_moves
-                policy /= np.sum(policy)
+            if is_terminal:
+                if stats is not None:
+                    stats.terminal_leaves += 1
+                self._backpropagate(path, value)
+                continue
                 
-                value = value.item()
+            # Close enough to the end to be solved: the exact value is backed
+            # up and, like a terminal, the node is never expanded.
+            if self.solver is not None and self.solver.get_empty_cells(state) <= self.args.get('solver_leaf_threshold', 0):
+                if stats is not None:
+                    stats.solver_leaves += 1
+                self._backpropagate(path, self.solver.get_value(state))
+                continue
                 
-                node.expand(policy)
+            evaluation = self._lookup(state)
+            if evaluation is not None:
+                if stats is not None:
+                    stats.cache_hits += 1
+                policy_logits, value = evaluation
+                # The next free buffer row serves as scratch for the planes.
+                encoded_state = self._encode_leaf(path, state, self.input_buffer[len(leaves)])
+                self._expand(node, state, policy_logits, encoded_state)
+                self._backpropagate(path, value)
+            else:
+                self._encode_leaf(path, state, self.input_buffer[len(leaves)])
+                self._backpropagate(path, virtual_loss=virtual_loss)
+                leaves.append((path, state))
                 
-            node.backpropagate(value)    
-            
+        return leaves, count
+    
+    def backup_leaves(self, leaves, policy_logits, values):
+        tree = self.tree
+        virtual_loss = self.args.get('virtual_loss', 1)
+        
+        for i, ((path, state), policy_logits, value) in enumerate(zip(leaves, policy_logits, values)):
+            node = path[-1]
+            value = value.item()
+            self._store(state, policy_logits, value)
             
-        action_probs = np.zeros(self.game.action_size)
-        for child in root.children:
-            action_probs[child.action_taken] = child.visit_count
-        action_probs /= np.sum(action_probs)
-        return action_probs
+            if len(path) == 1:
+                self._expand(node, state, policy_logits, self.input_buffer[i])
+                continue
+                
+            self._backpropagate(path, virtual_loss=-virtual_loss)
+            # With virtual loss spreading the paths a leaf is rarely
+            # picked twice per batch, but it must only be expanded once.
+            if not tree.is_fully_expanded(node):
+                self._expand(node, state, policy_logits, self.input_buffer[i])
+                
+            self._backpropagate(path, value)
     
+    def _simulate(self, root, num_searches, should_stop=None, time_limit=None, early_stopping=False):
+        tree = self.tree
+        batch_size = self.args.get('batch_size', 1)
+        start_time = time.perf_counter()
+        
+        search = 0
+        while search < num_searches:
+            if should_stop is not None and should_stop():
+                break
+            elapsed = time.perf_counter() - start_time
+            if time_limit is not None and elapsed >= time_limit:
+                break
+            if early_stopping:
+                remaining = num_searches - search
+                if time_limit is not None and search > 0 and elapsed > 0:
+                    remaining = min(remaining, (time_limit - elapsed) * search / elapsed)
+                if tree.is_decided(root, remaining):
+                    break
+                
+            leaves, simulations = self.select_leaves(min(batch_size, num_searches - search))
+            search += simulations
+            if len(leaves) > 0:
+                self.backup_leaves(leaves, *self._run_model(len(leaves)))
+
+def run_searches(model, game, searches, num_searches, batch_size=1):
+    # Searches many positions at once: searches is a list of (mcts, state)
+    # whose MCTS have no model of their own, and every round the leaves of
+    # all of them are evaluated by model in one batch. Trees reused from an
+    # earlier move only get the searches they are still short of. Returns
+    # the action probabilities of every search.
+    inputs = torch.empty(
+        (len(searches) * max(batch_size, 1), 3, game.row_count, game.column_count),
+        dtype=torch.float32,
+        pin_memory=model.device.type == "cuda"
+    )
+    input_buffer = inputs.numpy()
+    searches_left = []
+    for mcts, state in searches:
+        root = mcts.set_root(state)
+        searches_left.append(num_searches - (mcts.tree.visit_count[root] - 1))
+
+    while True:
+        requests = []
+        for i, (mcts, _) in enumerate(searches):
+            if not mcts.tree.is_fully_expanded(mcts.root):
+                leaves, _ = mcts.select_leaves(1)
+            elif searches_left[i] > 0:
+                leaves, simulations = mcts.select_leaves(min(batch_size, searches_left[i]))
+                searches_left[i] -= simulations
+            else:
+                continue
+            if len(leaves) > 0:
+                requests.append((mcts, leaves))
+
+        if len(requests) == 0:
+            if all(
+                left <= 0 and mcts.tree.is_fully_expanded(mcts.root)
+                for left, (mcts, _) in zip(searches_left, searches)
+            ):
+                return [mcts.tree.get_action_probs(mcts.root) for mcts, _ in searches]
+            continue
+
+        offset = 0
+        for mcts, leaves in requests:
+            input_buffer[offset:offset + len(leaves)] = mcts.input_buffer[:len(leaves)]
+            offset += len(leaves)
+        policy_logits, values = model(inputs[:offset].to(model.device, non_blocking=True))
+        policy_logits = policy_logits.cpu().numpy()
+        values = values.squeeze(1).cpu().numpy()
+        offset = 0
+        for mcts, leaves in requests:
+            mcts.backup_leaves(leaves, policy_logits[offset:offset + len(leaves)], values[offset:offset + len(leaves)])
+            offset += len(leaves)
+
 class ResBlock(nn.Module):
     def __init__(self, num_hidden):
         super().__init__()
@@ -175,3 +700,24 @@ class ResNet(nn.Module):
         policy = self.policyHead(x)
         value = self.valueHead(x)
         return policy, value
+
+# (num_resBlocks, num_hidden, weights_path) of every network AlphaZero can
+# run. The smaller tiers are students distilled from the full network; other
+# board geometries add their size to the file name (get_variant_path).
+NETWORK_TIERS = {
+    'full': (9, 128, "./ConnectFour_Weights.pt"),
+    'medium': (5, 64, "./ConnectFour_Weights_5x64.pt"),
+    'small': (3, 32, "./ConnectFour_Weights_3x32.pt")
+}
+
+def load_model(game, tier=None, device=torch.device("cpu"), weights_path=None, num_resBlocks=9, num_hidden=128):
+    # Either a named tier, or any weights file of the given size.
+    if tier is not None:
+        num_resBlocks, num_hidden, weights_path = NETWORK_TIERS[tier]
+        weights_path = game.get_variant_path(weights_path)
+    model = ResNet(game, num_resBlocks, num_hidden, device)
+    # torch.save's zip format can be memory-mapped, so the weights are paged
+    # in as they are copied into the model instead of read up front.
+    model.load_state_dict(torch.load(weights_path, map_location=device, mmap=True, weights_only=True))
+    model.eval()
+    return model
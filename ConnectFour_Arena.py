@@ -0,0 +1,254 @@
+import numpy as np
+import torch
+import multiprocessing as mp
+import argparse
+import json
+import math
+import os
+import time
+import ConnectFour_Logic
+import ConnectFour_AlphaZero_agent
+import ConnectFour_SelfPlay
+
+# Headless engine-vs-engine matches. Every opening is a few random plies
+# and is played twice with the colors swapped, so neither engine profits
+# from a lucky opening or from moving first. Arena spreads games over spawned
+# worker processes that each load both engines once; play_match plays them
+# in this process with networks that are already loaded.
+
+DEFAULT_ENGINE = {
+    'weights': "./ConnectFour_Weights.pt",
+    'num_resBlocks': 9,
+    'num_hidden': 128,
+    'optimize_inference': False,
+    'quantize': False,
+    'C': 2,
+    'num_searches': 800,
+    'dirichlet_epsilon': 0.0,
+    'dirichlet_alpha': 0.3,
+    'batch_size': 16,
+    'virtual_loss': 1,
+    'cache_size': 2**16
+}
+
+class Engine:
+    def __init__(self, game, config, model=None):
+        # Loads the network the config describes unless model is given.
+        self.game = game
+        self.config = dict(DEFAULT_ENGINE, **config)
+        if 'network_tier' in self.config:
+            self.config['num_resBlocks'], self.config['num_hidden'], self.config['weights'] = \
+                ConnectFour_AlphaZero_agent.NETWORK_TIERS[self.config['network_tier']]
+        if model is not None:
+            self.model = model
+        elif self.config['quantize']:
+            import ConnectFour_Quantization
+            self.model = ConnectFour_Quantization.load_quantized_model(
+                game, self.config['weights'], self.config['num_resBlocks'], self.config['num_hidden']
+            )
+        else:
+            self.model = ConnectFour_AlphaZero_agent.load_model(
+                game,
+                weights_path=self.config['weights'],
+                num_resBlocks=self.config['num_resBlocks'],
+                num_hidden=self.config['num_hidden']
+            )
+            if self.config['optimize_inference']:
+                import ConnectFour_Inference
+                self.model = ConnectFour_Inference.build_inference_model(self.model, game)
+        self.cache = ConnectFour_AlphaZero_agent.EvaluationCache(self.config['cache_size'])
+        self.mcts = ConnectFour_AlphaZero_agent.MCTS(game, self.config, self.model, self.cache)
+
+    def reset(self):
+        self.mcts.reset()
+
+    def get_action(self, state):
+        return int(np.argmax(self.mcts.search(state)))
+
+    def advance(self, action):
+        self.mcts.advance(action)
+
+def get_openings(game, num_openings, plies, seed=0):
+    rng = np.random.default_rng(seed)
+    openings = []
+    while len(openings) < num_openings:
+        _, opening = game.get_random_playout(plies, rng)
+        if len(opening) == plies:
+            openings.append(opening)
+    return openings
+
+def play_game(game, engines, opening):
+    # engines[0] moves first. Returns the score of engines[0] and the move
+    # times of each engine.
+    for engine in engines:
+        engine.reset()
+    move_times = ([], [])
+    state = game.get_initial_state()
+    turn = 0
+    while True:
+        if turn < len(opening):
+            action = opening[turn]
+        else:
+            start_time = time.perf_counter()
+            action = engines[turn % 2].get_action(state)
+            move_times[turn % 2].append(time.perf_counter() - start_time)
+        state = game.get_next_state(state, action, 1)
+        value, is_terminal = game.get_value_and_terminated(state, action)
+        if is_terminal:
+            if value == 0:
+                return 0.5, move_times
+            return (1.0 if turn % 2 == 0 else 0.0), move_times
+        state = game.change_perspective(state, -1)
+        for engine in engines:
+            engine.advance(action)
+        turn += 1
+
+def play_paired_game(game, engines, opening, swapped):
+    # Returns the score of engines[0] and the move times of each engine;
+    # engines[1] moves first when swapped.
+    if swapped:
+        score, (first_times, second_times) = play_game(game, engines[::-1], opening)
+        return 1 - score, second_times, first_times
+    score, (first_times, second_times) = play_game(game, engines, opening)
+    return score, first_times, second_times
+
+def _arena_worker(game, configs, tasks, results):
+    torch.set_num_threads(1)
+    np.random.seed(os.getpid())
+    engines = [Engine(game, config) for config in configs]
+    while True:
+        task = tasks.get()
+        if task is None:
+            break
+        game_index, opening, swapped = task
+        results.put((game_index,) + play_paired_game(game, engines, opening, swapped))
+
+def get_match_results(scores):
+    return {
+        'games': len(scores),
+        'wins': scores.count(1.0),
+        'draws': scores.count(0.5),
+        'losses': scores.count(0.0)
+    }
+
+def play_match(game, engine_a, engine_b, num_games, opening_plies=2, seed=0):
+    # Serial match between two loaded engines, scored from engine_a's view.
+    openings = get_openings(game, (num_games + 1) // 2, opening_plies, seed)
+    scores = [
+        play_paired_game(game, [engine_a, engine_b], openings[game_index // 2], game_index % 2 == 1)[0]
+        for game_index in range(num_games)
+    ]
+    return get_match_results(scores)
+
+def get_elo(scores, confidence=1.96, min_pairs=10):
+    # scores[2 * i] and scores[2 * i + 1] are the two colors of opening i,
+    # None until played. The standard error is taken over the pair means,
+    # which cancels what the opening itself is worth. With few pairs, or
+    # pairs that all scored alike, it falls back to the Wilson interval of
+    # the overall score instead of collapsing to zero width.
+    played = np.array([score for score in scores if score is not None], dtype=np.float64)
+    pairs = np.array([
+        (scores[i] + scores[i + 1]) / 2
+        for i in range(0, len(scores) - 1, 2)
+        if scores[i] is not None and scores[i + 1] is not None
+    ])
+    if len(played) == 0:
+        return 0.0, -math.inf, math.inf
+    mean = played.mean()
+    if len(pairs) >= min_pairs and pairs.std(ddof=1) > 0:
+        error = confidence * pairs.std(ddof=1) / math.sqrt(len(played) / 2)
+        low, high = mean - error, mean + error
+    else:
+        z2 = confidence ** 2 / len(played)
+        center = (mean + z2 / 2) / (1 + z2)
+        half = confidence * math.sqrt(mean * (1 - mean) / len(played) + z2 / (4 * len(played))) / (1 + z2)
+        low, high = center - half, center + half
+
+    def to_elo(score):
+        # A perfect score has no finite Elo difference.
+        if score <= 0:
+            return -math.inf
+        if score >= 1:
+            return math.inf
+        return 400 * math.log10(score / (1 - score))
+
+    return to_elo(mean), to_elo(low), to_elo(high)
+
+class Arena:
+    def __init__(self, game, config_a, config_b):
+        self.game = game
+        self.configs = [config_a, config_b]
+
+    def run(self, num_games, num_workers, opening_plies=4, seed=0, report_interval=30):
+        openings = get_openings(self.game, (num_games + 1) // 2, opening_plies, seed)
+        context = mp.get_context("spawn")
+        tasks = context.Queue()
+        results = context.Queue()
+        for game_index in range(num_games):
+            tasks.put((game_index, openings[game_index // 2], game_index % 2 == 1))
+        workers = [
+            context.Process(target=_arena_worker, args=(self.game, self.configs, tasks, results), daemon=True)
+            for _ in range(min(num_workers, num_games))
+        ]
+        for worker in workers:
+            tasks.put(None)
+            worker.start()
+
+        start_time = time.perf_counter()
+        last_report = start_time
+        scores = [None] * num_games
+        move_times = ([], [])
+        for games_done in range(1, num_games + 1):
+            game_index, score, times_a, times_b = ConnectFour_SelfPlay.get_from_workers(results, workers)
+            scores[game_index] = score
+            move_times[0].extend(times_a)
+            move_times[1].extend(times_b)
+            now = time.perf_counter()
+            if now - last_report >= report_interval:
+                elo, low, high = get_elo(scores)
+                print(f"{games_done}/{num_games} games, Elo {elo:+.0f} [{low:+.0f}, {high:+.0f}]")
+                last_report = now
+        for worker in workers:
+            worker.join()
+
+        elapsed = time.perf_counter() - start_time
+        elo, low, high = get_elo(scores)
+        stats = get_match_results(scores)
+        stats.update({
+            'elo': elo,
+            'elo_low': low,
+            'elo_high': high,
+            'move_time_a': float(np.mean(move_times[0])) if move_times[0] else 0.0,
+            'move_time_b': float(np.mean(move_times[1])) if move_times[1] else 0.0,
+            'games_per_hour': num_games / elapsed * 3600
+        })
+        return stats
+
+def _parse_engine(value):
+    # Either a JSON file or inline JSON, applied on top of DEFAULT_ENGINE.
+    if os.path.exists(value):
+        with open(value) as file:
+            return json.load(file)
+    return json.loads(value)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Play two Connect Four engine configurations against each other.")
+    parser.add_argument("--engine-a", type=_parse_engine, default={}, help="JSON overrides for engine A")
+    parser.add_argument("--engine-b", type=_parse_engine, default={}, help="JSON overrides for engine B")
+    parser.add_argument("--games", type=int, default=100)
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--opening-plies", type=int, default=4)
+    parser.add_argument("--seed", type=int, default=0)
+    options = parser.parse_args()
+
+    stats = Arena(ConnectFour_Logic.ConnectFour(), options.engine_a, options.engine_b).run(
+        options.games, options.workers, options.opening_plies, options.seed
+    )
+    print(
+        f"A vs B: +{stats['wins']} ={stats['draws']} -{stats['losses']}, "
+        f"Elo {stats['elo']:+.0f} (95% CI {stats['elo_low']:+.0f} to {stats['elo_high']:+.0f})"
+    )
+    print(
+        f"move time A {stats['move_time_a'] * 1000:.0f} ms, B {stats['move_time_b'] * 1000:.0f} ms, "
+        f"{stats['games_per_hour']:.0f} games/hour"
+    )
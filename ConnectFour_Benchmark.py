@@ -0,0 +1,199 @@
+import numpy as np
+import torch
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+import ConnectFour_Logic
+import ConnectFour_AlphaZero_agent
+import ConnectFour_Inference
+
+# Reproducible benchmarks for the rules, the search and the network. Every
+# result is a rate (higher is better) keyed by name, so a run can be
+# compared against a stored baseline metric by metric.
+
+def _measure(function, min_time=0.5):
+    # Calls function until min_time has passed and returns calls per second.
+    function()
+    calls = 0
+    start_time = time.perf_counter()
+    while True:
+        function()
+        calls += 1
+        elapsed = time.perf_counter() - start_time
+        if elapsed >= min_time:
+            return calls / elapsed
+
+def get_positions(game, num_positions, seed=0):
+    # Fixed, non-terminal positions from random playouts, with the move that
+    # produced each one.
+    rng = np.random.default_rng(seed)
+    positions = []
+    while len(positions) < num_positions:
+        state, actions = game.get_random_playout(rng.integers(1, game.row_count * game.column_count // 2), rng)
+        if len(actions) > 0:
+            positions.append((state, actions[-1]))
+    return positions
+
+def benchmark_logic(game, positions, num_batched_games=1024):
+    states = [state for state, _ in positions]
+    actions = [int(np.flatnonzero(game.get_valid_moves(state))[0]) for state in states]
+
+    def next_states():
+        for state, action in zip(states, actions):
+            game.get_next_state(state.copy(), action, 1)
+
+    def check_wins():
+        for state, action in positions:
+            game.check_win(state, action)
+
+    def valid_moves():
+        for state in states:
+            game.get_valid_moves(state)
+
+    encoded_state = np.empty((3, game.row_count, game.column_count), dtype=np.float32)
+
+    def encoded_states():
+        for state in states:
+            game.get_encoded_state(state, encoded_state)
+
+    # Each position's own planes stand in for its parent's; only the cost
+    # of the update is measured.
+    parent_encoded_states = [game.get_encoded_state(state) for state in states]
+
+    def next_encoded_states():
+        for (state, action), parent_encoded_state in zip(positions, parent_encoded_states):
+            game.get_next_encoded_state(parent_encoded_state, state, action, encoded_state)
+
+    results = {
+        f"logic.{name}": _measure(function) * len(states)
+        for name, function in (
+            ("get_next_state", next_states),
+            ("check_win", check_wins),
+            ("get_valid_moves", valid_moves),
+            ("get_encoded_state", encoded_states),
+            ("get_next_encoded_state", next_encoded_states)
+        )
+    }
+
+    # A random move on each of num_batched_games boards per step.
+    batched_game = ConnectFour_Logic.BatchedConnectFour(game, num_batched_games)
+    rng = np.random.default_rng(0)
+
+    def batched_steps():
+        valid_moves = batched_game.get_valid_moves()
+        batched_game.get_next_state(np.argmax(valid_moves * rng.random(valid_moves.shape), axis=1))
+
+    results["logic.batched_get_next_state"] = _measure(batched_steps) * num_batched_games
+    results["logic.batched_get_encoded_state"] = _measure(batched_game.get_encoded_state) * num_batched_games
+    return results
+
+def benchmark_search(game, model, positions, num_searches=256):
+    args = {
+        'C': 2,
+        'num_searches': num_searches,
+        'dirichlet_epsilon': 0.0,
+        'dirichlet_alpha': 0.3,
+        'batch_size': 16,
+        'virtual_loss': 1
+    }
+    results = {}
+    for name, batch_size in (("search.simulations_per_sec", 1), ("search.batched_simulations_per_sec", 16)):
+        args['batch_size'] = batch_size
+        mcts = ConnectFour_AlphaZero_agent.MCTS(game, args, model)
+        start_time = time.perf_counter()
+        for state, _ in positions:
+            mcts.reset()
+            mcts.search(state)
+        results[name] = num_searches * len(positions) / (time.perf_counter() - start_time)
+    return results
+
+def benchmark_model(game, model, name, batch_sizes, thread_counts):
+    results = {}
+    default_threads = torch.get_num_threads()
+    encoded_states = ConnectFour_Inference.get_sample_positions(game, max(batch_sizes), seed=1)
+    for threads in thread_counts:
+        torch.set_num_threads(threads)
+        for batch_size in batch_sizes:
+            x = torch.tensor(encoded_states[:batch_size], device=model.device)
+            with torch.inference_mode():
+                calls_per_sec = _measure(lambda: model(x))
+            results[f"{name}.batch_{batch_size}.threads_{threads}.positions_per_sec"] = calls_per_sec * batch_size
+    torch.set_num_threads(default_threads)
+    return results
+
+def run_benchmarks(weights_path=None, num_positions=32, num_searches=256, batch_sizes=(1, 8, 64), thread_counts=(1,)):
+    game = ConnectFour_Logic.ConnectFour()
+    positions = get_positions(game, num_positions)
+    # Random weights are fine for timing; seeding keeps them the same.
+    torch.manual_seed(0)
+    if weights_path is not None:
+        model = ConnectFour_AlphaZero_agent.load_model(game, weights_path=weights_path)
+    else:
+        model = ConnectFour_AlphaZero_agent.ResNet(game, 9, 128, torch.device("cpu")).eval()
+
+    results = {}
+    results.update(benchmark_logic(game, positions))
+    results.update(benchmark_search(game, model, positions[:8], num_searches))
+    results.update(benchmark_model(game, model, "resnet", batch_sizes, thread_counts))
+    results.update(benchmark_model(
+        game, ConnectFour_Inference.build_inference_model(model, game), "inference_model", batch_sizes, thread_counts
+    ))
+    return {
+        'machine': {
+            'platform': platform.platform(),
+            'processor': platform.processor(),
+            'cpu_count': os.cpu_count(),
+            'python': platform.python_version(),
+            'torch': torch.__version__
+        },
+        'results': results
+    }
+
+def compare(results, baseline, margin):
+    # Returns (name, baseline, current, change) for every metric that fell
+    # more than margin below the baseline.
+    regressions = []
+    for name, baseline_value in baseline['results'].items():
+        value = results['results'].get(name)
+        if value is None:
+            continue
+        change = value / baseline_value - 1
+        if change < -margin:
+            regressions.append((name, baseline_value, value, change))
+    return regressions
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark the Connect Four logic, search and network.")
+    parser.add_argument("--weights", default=None, help="state_dict to benchmark with (random weights if omitted)")
+    parser.add_argument("--output", default="./benchmark.json")
+    parser.add_argument("--baseline", default=None, help="results to compare against")
+    parser.add_argument("--margin", type=float, default=0.1, help="allowed slowdown before a metric fails")
+    parser.add_argument("--searches", type=int, default=256)
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 8, 64])
+    parser.add_argument("--threads", type=int, nargs="+", default=[1, torch.get_num_threads()])
+    options = parser.parse_args()
+
+    results = run_benchmarks(
+        options.weights,
+        num_searches=options.searches,
+        batch_sizes=options.batch_sizes,
+        thread_counts=sorted(set(options.threads))
+    )
+    with open(options.output, "w") as file:
+        json.dump(results, file, indent=4)
+    for name, value in results['results'].items():
+        print(f"{name:60s} {value:14.1f}/s")
+
+    if options.baseline is not None:
+        with open(options.baseline) as file:
+            baseline = json.load(file)
+        regressions = compare(results, baseline, options.margin)
+        for name, baseline_value, value, change in regressions:
+            print(f"REGRESSION {name}: {baseline_value:.1f}/s -> {value:.1f}/s ({change:+.1%})")
+        if regressions:
+            print(f"FAIL: {len(regressions)} metric(s) more than {options.margin:.0%} below {options.baseline}")
+            sys.exit(1)
+        print(f"PASS: no metric more than {options.margin:.0%} below {options.baseline}")
@@ -0,0 +1,109 @@
+import torch
+import torch.nn.functional as F
+import argparse
+import os
+import ConnectFour_Logic
+import ConnectFour_AlphaZero_agent
+import ConnectFour_Arena
+import ConnectFour_Inference
+import ConnectFour_Training
+
+# Trains a small student ResNet to imitate the full network. The targets are
+# the teacher's own policy and value on each batch, so no search is needed:
+# positions come from self-play shards when there are any, and from random
+# playouts otherwise.
+
+class Distiller(ConnectFour_Training.Trainer):
+    # Trains self.model, the student; only the loss differs from Trainer.
+    def __init__(self, teacher, student, optimizer, args):
+        super().__init__(student, optimizer, args)
+        self.teacher = teacher
+
+    def get_losses(self, batch):
+        temperature = self.args.get('temperature', 1.0)
+        states = batch[0].to(self.model.device, non_blocking=True)
+        with torch.inference_mode():
+            teacher_policy, teacher_value = self.teacher(states.to(self.teacher.device))
+        teacher_policy = F.softmax(teacher_policy.to(self.model.device) / temperature, dim=1).clone()
+        teacher_value = teacher_value.to(self.model.device).clone()
+
+        out_policy, out_value = self.model(states)
+        policy_loss = F.kl_div(
+            F.log_softmax(out_policy / temperature, dim=1), teacher_policy, reduction='batchmean'
+        ) * temperature ** 2
+        return policy_loss, F.mse_loss(out_value, teacher_value)
+
+    def train(self, loader):
+        self.teacher.eval()
+        return super().train(loader)
+
+def get_random_position_loader(game, batch_size, num_batches, seed):
+    positions = torch.tensor(ConnectFour_Inference.get_sample_positions(game, batch_size * num_batches, seed))
+    return torch.utils.data.DataLoader(torch.utils.data.TensorDataset(positions), batch_size=batch_size, shuffle=True)
+
+def get_agreement(teacher, student, game, num_positions=1024):
+    positions = torch.tensor(ConnectFour_Inference.get_sample_positions(game, num_positions, seed=1))
+    with torch.inference_mode():
+        teacher_policy, teacher_value = teacher(positions.to(teacher.device))
+        student_policy, student_value = student(positions.to(student.device))
+    return (
+        (teacher_policy.argmax(dim=1).cpu() == student_policy.argmax(dim=1).cpu()).float().mean().item(),
+        (teacher_value.cpu() - student_value.cpu()).abs().mean().item()
+    )
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Distill the full Connect Four ResNet into a smaller network tier.")
+    parser.add_argument("--tier", default="small", choices=[tier for tier in ConnectFour_AlphaZero_agent.NETWORK_TIERS if tier != "full"])
+    parser.add_argument("--data", default="./selfplay", help="self-play shards to take positions from")
+    parser.add_argument("--iterations", type=int, default=10)
+    parser.add_argument("--batches", type=int, default=1000, help="batches per iteration")
+    parser.add_argument("--batch-size", type=int, default=256)
+    parser.add_argument("--window", type=int, default=2**22)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--lr", type=float, default=0.001)
+    parser.add_argument("--weight-decay", type=float, default=0.0001)
+    parser.add_argument("--temperature", type=float, default=1.0)
+    parser.add_argument("--games", type=int, default=20, help="student vs teacher games to play at the end")
+    parser.add_argument("--searches", type=int, default=200)
+    parser.add_argument("--device", default="cuda" if torch.cuda.is_available() else "cpu")
+    options = parser.parse_args()
+
+    game = ConnectFour_Logic.ConnectFour()
+    device = torch.device(options.device)
+    teacher = ConnectFour_AlphaZero_agent.load_model(game, "full", device)
+    num_resBlocks, num_hidden, weights_path = ConnectFour_AlphaZero_agent.NETWORK_TIERS[options.tier]
+    weights_path = game.get_variant_path(weights_path)
+    if os.path.exists(weights_path):
+        student = ConnectFour_AlphaZero_agent.load_model(game, options.tier, device)
+    else:
+        student = ConnectFour_AlphaZero_agent.ResNet(game, num_resBlocks, num_hidden, device)
+    optimizer = torch.optim.Adam(student.parameters(), lr=options.lr, weight_decay=options.weight_decay)
+    distiller = Distiller(teacher, student, optimizer, vars(options))
+
+    buffer = ConnectFour_Training.ReplayBuffer(game, options.data, options.window)
+    for iteration in range(options.iterations):
+        buffer.refresh()
+        if len(buffer) > 0:
+            loader = ConnectFour_Training.get_data_loader(
+                buffer, options.batch_size, options.batches, options.workers, device.type == "cuda"
+            )
+        else:
+            loader = get_random_position_loader(game, options.batch_size, options.batches, iteration)
+        stats = distiller.train(loader)
+        torch.save(student.state_dict(), weights_path)
+        print(
+            f"iteration {iteration}: policy KL {stats['policy_loss']:.4f}, value loss {stats['value_loss']:.4f}, "
+            f"{stats['samples_per_sec']:.0f} samples/sec -> {weights_path}"
+        )
+
+    agreement, value_error = get_agreement(teacher, student, game)
+    print(f"policy top-1 agreement {agreement:.1%}, mean value error {value_error:.4f}")
+    if options.games > 0:
+        config = {'num_searches': options.searches, 'batch_size': 8}
+        results = ConnectFour_Arena.play_match(
+            game,
+            ConnectFour_Arena.Engine(game, config, student),
+            ConnectFour_Arena.Engine(game, config, teacher),
+            options.games
+        )
+        print(f"{options.tier} vs full over {options.games} games: +{results['wins']} ={results['draws']} -{results['losses']}")
@@ -1,14 +1,16 @@
-import ConnectFour_AlphaZero_agent
 import ConnectFour_Logic
 from enum import Enum
+import logging
+import math
+import os
 import random
 import time
 import functools
+import html
 import numpy as np
-import torch
 from copy import copy
 from PySide6.QtCore import QTimer, Qt, Signal, QRect, QThread, Slot
-from PySide6.QtGui import QPainter, QColor, QPen, QFont, QBrush
+from PySide6.QtGui import QPainter, QColor, QPen, QFont, QBrush, QPixmap, QFontMetrics
 from PySide6.QtWidgets import QWidget, QPushButton, QMainWindow, QTextBrowser, QGraphicsBlurEffect
 
 class CurrentPlayer(Enum):
@@ -26,42 +28,155 @@ class gameStatus(Enum):
 class AlphaZero(QThread):
     def __init__(self, parent):
         super().__init__(parent)
-        self.device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-        self.game = ConnectFour_Logic.ConnectFour()
+        self.game = parent.game
         self.args = {
             'C': 2,
             'num_searches': 2048,
             'dirichlet_epsilon': 0.0,
-            'dirichlet_alpha': 0.3
+            'dirichlet_alpha': 0.3,
+            'batch_size': 16,
+            'virtual_loss': 1,
+            'cache_size': 2**17,
+            'ponder': True,
+            'max_ponder_searches': 2**15,
+            'time_limit': 5.0,
+            'early_stopping': True,
+            'optimize_inference': True,
+            'quantize': False,
+            'network_tier': 'full',
+            'opening_book': "./ConnectFour_Book.npy",
+            'solver_threshold': 14,
+            'solver_leaf_threshold': 10,
+            'collect_stats': True,
+            'show_search_stats': False
         }
-        self.model = ConnectFour_AlphaZero_agent.ResNet(self.game, 9, 128, self.device)
-        self.model.load_state_dict(torch.load("./ConnectFour_Weights.pt", map_location=self.device))
-        self.model.eval()
-        self.mcts = ConnectFour_AlphaZero_agent.MCTS(self.game, self.args, self.model)
+        self.ready = False
+        # The human's move, applied to the tree by run() so that rerooting a
+        # large pondered tree does not stall the UI thread.
+        self.humanMove = None
+        self._running = True
+        self._pondering = False
+
+    def loadModel(self):
+        # Imported here, on this thread, so the window opens before torch
+        # has even been loaded.
+        import torch
+        import ConnectFour_AlphaZero_agent
+        import ConnectFour_Inference
+        import ConnectFour_OpeningBook
+        import ConnectFour_Quantization
+        import ConnectFour_Solver
+        self.device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+        if self.args['quantize'] and self.device.type == "cpu":
+            num_resBlocks, num_hidden, weights_path = ConnectFour_AlphaZero_agent.NETWORK_TIERS[self.args['network_tier']]
+            self.model = ConnectFour_Quantization.load_quantized_model(
+                self.game, self.game.get_variant_path(weights_path), num_resBlocks, num_hidden
+            )
+        else:
+            self.model = ConnectFour_AlphaZero_agent.load_model(self.game, self.args['network_tier'], self.device)
+        if self.args['optimize_inference'] and not isinstance(self.model, ConnectFour_Quantization.QuantizedResNet):
+            self.model = ConnectFour_Inference.build_inference_model(self.model, self.game, fallback=True)
+        self.evaluationCache = ConnectFour_AlphaZero_agent.EvaluationCache(self.args['cache_size'])
+        self.solver = ConnectFour_Solver.Solver(self.game)
+        self.mcts = ConnectFour_AlphaZero_agent.MCTS(self.game, self.args, self.model, self.evaluationCache, self.solver)
+        self.openingBook = None
+        opening_book = self.game.get_variant_path(self.args['opening_book'])
+        if os.path.exists(opening_book):
+            self.openingBook = ConnectFour_OpeningBook.OpeningBook(self.game, opening_book)
+        # Warm up on the opening position, which is also the first one the
+        # engine will be asked about.
+        self.mcts.search(self.game.get_initial_state(), num_searches=1)
+        self.mcts.reset()
+        self.mcts.stats_callback = self.searchFinished
+        self.ready = True
+        self.parent().modelReadySignal.emit()
+
+    def searchFinished(self, stats):
+        logging.getLogger(__name__).info("search: %s", stats)
+        self.parent().searchStatsSignal.emit(stats.get_stats())
+
+    def startPondering(self):
+        if not self.args['ponder'] or not self.ready:
+            return
+        self.wait()
         self._running = True
+        self._pondering = True
+        self.start()
+
+    def stopPondering(self):
+        if self._pondering:
+            self._pondering = False
+            self.wait()
 
     def run(self):
+        if not self.ready:
+            # A missing or broken weights file must not leave the window
+            # waiting on "(loading...)" forever.
+            try:
+                self.loadModel()
+            except Exception as error:
+                logging.getLogger(__name__).exception("could not load the engine")
+                self.parent().modelErrorSignal.emit(f"{type(error).__name__}: {error}")
+            return
+        if self.humanMove is not None:
+            self.mcts.advance(self.humanMove)
+            self.humanMove = None
+        if self._pondering:
+            self.ponder()
+            return
         state = copy(self.parent().board.state)
         player = copy(self.parent().player.value)
         if self.parent().status == gameStatus.IN_PROGRESS and self.parent().player == CurrentPlayer.COMPUTER:
-            neutral_state = self.game.change_perspective(copy(state), player)
-            mcts_probs = self.mcts.search(neutral_state)
+            neutral_state = self.game.change_perspective(self.game.array_to_state(state), player)
+            # Never let the search run into the move clock.
+            time_left = (self.parent().timer.max_time_ms - self.parent().timer.time_elapsed) / 1000
+            time_limit = max(min(self.args['time_limit'], time_left - 1), 0.1)
+            mcts_probs = None
+            if self.openingBook is not None:
+                mcts_probs = self.openingBook.lookup(neutral_state)
+            if mcts_probs is None and self.solver.get_empty_cells(neutral_state) <= self.args['solver_threshold']:
+                mcts_probs = self.solver.get_action_probs(neutral_state)
+            if mcts_probs is None:
+                mcts_probs = self.mcts.search(neutral_state, time_limit=time_limit, should_stop=lambda: not self._running)
             action = np.argmax(mcts_probs)
+            self.mcts.advance(action)
             if state[1, action] != 0:
                 self.parent().board.button_i_status[action] = False
-            next_state = self.game.get_next_state(state, action, player)
+            next_state = self.game.get_next_state(self.game.array_to_state(state), action, player)
             val, is_terminal = self.game.get_value_and_terminated(next_state, action)
             if self._running == False:
                 return 0
             else:
-                return_dict = {"state": next_state, "val": val, "is_terminal": is_terminal}
+                return_dict = {"state": self.game.state_to_array(next_state), "val": val, "is_terminal": is_terminal}
                 self.parent().computerMoveSignal.emit(return_dict)
 
+    def ponder(self):
+        state = copy(self.parent().board.state)
+        if self.parent().status == gameStatus.IN_PROGRESS and self.parent().player == CurrentPlayer.HUMAN:
+            neutral_state = self.game.change_perspective(self.game.array_to_state(state), CurrentPlayer.HUMAN.value)
+            self.mcts.ponder(neutral_state, lambda: not (self._pondering and self._running))
+
 class gameInfoWidget(QWidget):
     def __init__(self, parent):
         super().__init__(parent)
         self.currentPiece = ["🔵", "🟢"]
         self.turnStr = ["My Turn", "Your Turn", "My Turn"]
+        self.searchStats = None
+
+    @Slot(dict)
+    def showSearchStats(self, stats):
+        if self.parent().alphazero.args['show_search_stats']:
+            self.searchStats = stats
+            self.update()
+
+    def draw_search_stats(self, qp):
+        qp.setFont(QFont("HP Simplified JPan", 8))
+        qp.drawText(
+            QRect(self.rect().x(), self.rect().y(), self.rect().width(), self.rect().height()*(1/6)),
+            Qt.AlignCenter,
+            f"{self.searchStats['simulations']} sims, depth {self.searchStats['max_depth']}, "
+            f"net {self.searchStats['inference_time'] / max(self.searchStats['total_time'], 1e-9):.0%}"
+        )
 
     def draw_status(self, qp):
         self.emoji_font = QFont("HP Simplified JPan", 50)
@@ -152,6 +267,8 @@ class gameInfoWidget(QWidget):
         qp.setPen(Qt.white)
         qp.fillRect(self.rect(), QBrush(QColor(0, 0, 0)))
         self.draw_status(qp)
+        if self.searchStats is not None and self.parent().status == gameStatus.IN_PROGRESS:
+            self.draw_search_stats(qp)
         qp.end()
             
 class Timer(QThread):
@@ -186,27 +303,87 @@ class TimerWidget(QWidget):
         self.cellWidth = cellWidth
         self.max_time_ms = self.parent().timer.max_time_ms
         self.time_elapsed = 0
+        self.textFont = QFont()
+        self.textFont.setPointSize(14)
+        # Background and white ring, redrawn only when the widget is resized.
+        self.background = None
+        self.drawnFace = None
+
+    def getCircleRect(self):
+        w = min(self.width(), self.height()) - self.cellWidth
+        return QRect(int(self.cellWidth/2), int(self.cellWidth/2), w, w)
+
+    def getSpanAngle(self):
+        return abs(int((self.max_time_ms - self.time_elapsed) / self.max_time_ms * 360 * 16))
+
+    def getText(self):
+        time_left_in_seconds = int(abs(self.max_time_ms - self.time_elapsed)/1000)
+        return f"Time Left:\n{time_left_in_seconds} seconds"
+
+    def getFace(self):
+        return (self.getSpanAngle(), self.getText(), self.parent().board.moveCount%2)
+
+    def getArcRect(self, from_angle, to_angle):
+        # Bounding rect of the ring between two angles given in 1/16ths of a
+        # degree, counterclockwise from 3 o'clock like drawArc.
+        low, high = sorted((from_angle / 16, to_angle / 16))
+        angles = [low, high] + [angle for angle in range(0, 720, 90) if low < angle < high]
+        circle = self.getCircleRect()
+        radius = circle.width() / 2
+        xs = [circle.x() + radius + radius * math.cos(math.radians(angle)) for angle in angles]
+        ys = [circle.y() + radius - radius * math.sin(math.radians(angle)) for angle in angles]
+        margin = 8
+        return QRect(
+            int(min(xs)) - margin,
+            int(min(ys)) - margin,
+            int(max(xs) - min(xs)) + 2*margin + 1,
+            int(max(ys) - min(ys)) + 2*margin + 1
+        )
+
+    def getTextRect(self, text):
+        return QFontMetrics(self.textFont).boundingRect(self.getCircleRect(), Qt.AlignCenter, text).adjusted(-2, -2, 2, 2)
 
     def timeElapsed(self, time_elapsed):
         self.time_elapsed = time_elapsed
-        self.update()
+        if self.drawnFace is None:
+            self.update()
+            return
+        span_angle, text, color = self.getFace()
+        drawn_span_angle, drawn_text, drawn_color = self.drawnFace
+        if color != drawn_color:
+            self.update()
+            return
+        # The arc moves a fraction of a degree per tick, so only the sliver
+        # it uncovered and, once a second, the text are repainted.
+        if span_angle != drawn_span_angle:
+            self.update(self.getArcRect(90*16 + drawn_span_angle, 90*16 + span_angle))
+        if text != drawn_text:
+            self.update(self.getTextRect(drawn_text).united(self.getTextRect(text)))
 
     def paintEvent(self, event):
+        ratio = self.devicePixelRatioF()
+        if self.background is None or self.background.size() != self.size() * ratio:
+            self.background = QPixmap(self.size() * ratio)
+            self.background.setDevicePixelRatio(ratio)
+            self.background.fill(QColor(0, 0, 0))
+            qp = QPainter(self.background)
+            qp.setRenderHint(QPainter.Antialiasing)
+            pen = QPen()
+            pen.setColor(QColor(255, 255, 255))
+            pen.setWidth(10)
+            qp.setPen(pen)
+            qp.drawEllipse(self.getCircleRect())
+            qp.end()
+
         qp = QPainter(self)
         if not qp.isActive():
             qp.begin(self)
         qp.setRenderHint(QPainter.Antialiasing)
-        qp.fillRect(self.rect(), QBrush(QColor(0, 0, 0)))
-        rect = self.rect()
-        w = min(rect.width(), rect.height()) - self.cellWidth
-        rect = QRect(self.cellWidth/2, self.cellWidth/2, w, w)
+        qp.drawPixmap(event.rect(), self.background, QRect(event.rect().topLeft() * ratio, event.rect().size() * ratio))
+        rect = self.getCircleRect()
         start_angle = 90 * 16 
-        span_angle = abs(int((self.max_time_ms - self.time_elapsed) / self.max_time_ms * 360 * 16))
+        span_angle = self.getSpanAngle()
         pen = QPen()
-        pen.setColor(QColor(255, 255, 255))
-        pen.setWidth(10)
-        qp.setPen(pen)
-        qp.drawEllipse(rect)
         if self.parent().board.moveCount%2 == 0:
             pen.setColor(QColor(0, 210, 106))
         else:
@@ -214,23 +391,29 @@ class TimerWidget(QWidget):
         pen.setWidth(11)
         qp.setPen(pen)
         qp.drawArc(rect, start_angle, span_angle)
-        font = QFont()
-        font.setPointSize(14)
-        qp.setFont(font)
-        time_left_in_seconds = int(abs(self.max_time_ms - self.time_elapsed)/1000)
-        qp.drawText(rect, Qt.AlignCenter, f"Time Left:\n{time_left_in_seconds} seconds")
+        text = self.getText()
+        if event.rect().intersects(self.getTextRect(text)):
+            qp.setFont(self.textFont)
+            qp.drawText(rect, Qt.AlignCenter, text)
         qp.end()
+        self.drawnFace = self.getFace()
 
 class Connect4Board(QWidget):
     def __init__(self, parent, cellWidth):
         super().__init__(parent)
         self.cellWidth = cellWidth
-        self.c4logic = ConnectFour_Logic.ConnectFour()
+        self.c4logic = self.parent().game
+        self.rows = self.c4logic.row_count
+        self.columns = self.c4logic.column_count
         self.buttons = []
-        self.button_i_status = [True for _ in range(7)]
-        self.state = np.zeros([6,7])
-        self.moveSequence = np.zeros([6,7])
+        self.button_i_status = [True for _ in range(self.columns)]
+        self.state = np.zeros([self.rows,self.columns])
+        self.moveSequence = np.zeros([self.rows,self.columns])
         self.moveCount = 0
+        # The grid and the discs as last painted; paintEvent only redraws the
+        # cells whose color differs from drawnColors.
+        self.pixmap = None
+        self.drawnColors = None
         self.initUI()
 
     def initUI(self):
@@ -240,66 +423,104 @@ class Connect4Board(QWidget):
 
     def createButtons(self):
         font = QFont("HP Simplified JPan", 15) 
-        for column in range(7):
+        for column in range(self.columns):
             self.buttons.append(QPushButton(f"{column+1}", self))
             self.buttons[column].setFont(font)
-            self.buttons[column].setGeometry((column+0.75)*self.cellWidth, 6.75*self.cellWidth, self.cellWidth/2, self.cellWidth/2)
+            self.buttons[column].setGeometry((column+0.75)*self.cellWidth, (self.rows+0.75)*self.cellWidth, self.cellWidth/2, self.cellWidth/2)
             self.buttons[column].clicked.connect(functools.partial(self.buttonClicked, column))
         if self.parent().player == CurrentPlayer.COMPUTER:
             self.toggleMoveButtons(False)
 
     def toggleMoveButtons(self, on=False):
         if on:
-            for column in range(0, 7):
+            for column in range(0, self.columns):
                 if self.button_i_status[column]:
                     self.buttons[column].setEnabled(True)
         else:
-            for column in range(0, 7):
+            for column in range(0, self.columns):
                 self.buttons[column].setEnabled(False)
 
+    def getCellColors(self):
+        # 0 for an empty cell, 1 for a green disc and 2 for a blue one.
+        return np.where(self.state != 0, 1 + np.abs(self.moveSequence)%2, 0)
+
+    def getCellRect(self, row, column):
+        return QRect(
+            int((column+0.5)*self.cellWidth),
+            int((row+0.52)*self.cellWidth),
+            int(0.96*self.cellWidth),
+            int(0.96*self.cellWidth)
+        )
+
+    def refresh(self):
+        if self.drawnColors is None:
+            self.update()
+            return
+        for row, column in zip(*np.nonzero(self.getCellColors() != self.drawnColors)):
+            self.update(self.getCellRect(row, column))
+
     def paintEvent(self, event):
+        ratio = self.devicePixelRatioF()
+        colors = self.getCellColors()
+        if self.pixmap is None or self.pixmap.size() != self.size() * ratio:
+            self.pixmap = QPixmap(self.size() * ratio)
+            self.pixmap.setDevicePixelRatio(ratio)
+            self.pixmap.fill(QColor(0, 0, 0))
+            qp = QPainter(self.pixmap)
+            qp.setRenderHint(QPainter.Antialiasing)
+            self.drawGrid(qp)
+            self.drawMoves(qp, colors, zip(*np.nonzero(colors)))
+            qp.end()
+        elif np.any(colors != self.drawnColors):
+            qp = QPainter(self.pixmap)
+            qp.setRenderHint(QPainter.Antialiasing)
+            self.drawMoves(qp, colors, zip(*np.nonzero(colors != self.drawnColors)))
+            qp.end()
+        self.drawnColors = colors
+
         qp = QPainter(self)
         if not qp.isActive():
             qp.begin(self)
-        qp.setRenderHint(QPainter.Antialiasing)
-        qp.fillRect(self.rect(), QBrush(QColor(0, 0, 0)))
-        self.drawGrid(qp)
-        self.drawMoves(qp)
+        qp.drawPixmap(event.rect(), self.pixmap, QRect(event.rect().topLeft() * ratio, event.rect().size() * ratio))
         qp.end()
         
     def drawGrid(self, qp):
         qp.setPen(QColor(150, 150, 150))
         qp.setBrush(Qt.white)
-        for i in range(0, 7):
-           qp.drawLine(0.48*self.cellWidth, (i+0.5)*self.cellWidth, 7.48*self.cellWidth, (i+0.5)*self.cellWidth)
-        for i in range(0, 8):
-           qp.drawLine((i+0.48)*self.cellWidth, self.cellWidth/2, (i+0.48)*self.cellWidth, 6.5*self.cellWidth)
-
-    def drawMoves(self, qp):
-        for i in range(0, 6):
-            for j in range(0, 7):
-                if self.state[i][j]:
-                    if abs(self.moveSequence[i][j])%2 == 0:
-                        qp.setPen(QColor(0, 210, 106))
-                        qp.setBrush(QColor(0, 210, 106))
-                    else:
-                        qp.setPen(QColor(0, 116, 186))
-                        qp.setBrush(QColor(0, 116, 186))
-                    qp.drawEllipse((j+0.58)*self.cellWidth, (i+0.6)*self.cellWidth, 0.8*self.cellWidth, 0.8*self.cellWidth)
+        for i in range(0, self.rows+1):
+           qp.drawLine(0.48*self.cellWidth, (i+0.5)*self.cellWidth, (self.columns+0.48)*self.cellWidth, (i+0.5)*self.cellWidth)
+        for i in range(0, self.columns+1):
+           qp.drawLine((i+0.48)*self.cellWidth, self.cellWidth/2, (i+0.48)*self.cellWidth, (self.rows+0.5)*self.cellWidth)
+
+    def drawMoves(self, qp, colors, cells):
+        for i, j in cells:
+            qp.fillRect(self.getCellRect(i, j), QColor(0, 0, 0))
+            if colors[i][j] == 1:
+                qp.setPen(QColor(0, 210, 106))
+                qp.setBrush(QColor(0, 210, 106))
+            elif colors[i][j] == 2:
+                qp.setPen(QColor(0, 116, 186))
+                qp.setBrush(QColor(0, 116, 186))
+            else:
+                continue
+            qp.drawEllipse((j+0.58)*self.cellWidth, (i+0.6)*self.cellWidth, 0.8*self.cellWidth, 0.8*self.cellWidth)
             
     def buttonClicked(self, column):
+        self.parent().alphazero.stopPondering()
         row = np.max(np.where(self.state[:, column] == 0))
         if row == 0:
             self.button_i_status[column] = False
         self.toggleMoveButtons(False)
         self.state[row][column] = self.parent().player.value
         self.moveSequence[row][column] = self.moveCount*self.parent().player.value
-        self.update()
-        if self.c4logic.check_win(self.state, column):
+        self.refresh()
+        self.parent().alphazero.humanMove = column
+        board_state = self.c4logic.array_to_state(self.state)
+        if self.c4logic.check_win(board_state, column):
             self.parent().status = gameStatus.HUMAN_WON
             self.parent().gameOverSignal.emit()
             print(self.parent().player,"Won")
-        elif np.sum(self.c4logic.get_valid_moves(self.state)) == 0:
+        elif np.sum(self.c4logic.get_valid_moves(board_state)) == 0:
             self.parent().status = gameStatus.DRAW
             self.parent().gameOverSignal.emit()
             print("Draw")
@@ -313,12 +534,12 @@ class Connect4Board(QWidget):
         self.parent().gameInfo.update()
 
     def computerMove(self, data):
-        lonely_next_move = np.zeros([6, 7])
-        for row in range(6):
-            for col in range(7):
+        lonely_next_move = np.zeros([self.rows, self.columns])
+        for row in range(self.rows):
+            for col in range(self.columns):
                 lonely_next_move[row][col] = self.state[row][col] - data["state"][row][col]
-        for row in range(6):
-            for column in range(7):
+        for row in range(self.rows):
+            for column in range(self.columns):
                 if lonely_next_move[row][column] == 1:
                     self.state[row][column] = -1
                     self.moveSequence[row][column] = self.moveCount*self.parent().player.value
@@ -326,7 +547,7 @@ class Connect4Board(QWidget):
             if lonely_next_move[row][column] == 1:
                 break
         val = data["val"]
-        self.update()
+        self.refresh()
         if data["is_terminal"]:
             if val == 1:
                 self.parent().status = gameStatus.HUMAN_LOST
@@ -341,6 +562,8 @@ class Connect4Board(QWidget):
                 self.toggleMoveButtons(True)
             self.parent().timer.resetTimer()
             self.parent().switchPlayer()
+            if not self.parent().pauseGame.pauseFlag:
+                self.parent().alphazero.startPondering()
         self.parent().gameInfo.update()
 
 class pieceSelector(QWidget):
@@ -355,21 +578,25 @@ class pieceSelector(QWidget):
         self.createButtons()
         self.setVisible(True)
         self.firstPlayer = 0
+        self.loadError = None
 
     def createButtons(self):
         self.choiceButtons = []
         choices = ["🟢", "🔵"]
+        # The choices sit under the centered text, laid out for a 10.5 cell wide window.
+        offset = (self.parent().width() / self.parent().cellWidth - 10.5) / 2
         for i in range(0,2):
             choiceButton_i = QPushButton(choices[i], self)
             choiceButton_i.setFont(QFont("HP Simplified JPan", 8))
             choiceButton_i.setGeometry(
-                (i * 1.355 + 4.25) * self.parent().cellWidth,       # x
+                (i * 1.355 + 4.25 + offset) * self.parent().cellWidth,       # x
                 3.15 * self.parent().cellWidth,                     # y
                 self.parent().cellWidth/1.65,                       # width
                 self.parent().cellWidth/1.65                        # height
             )
             choiceButton_i.setStyleSheet("border: none; background: transparent;")
             choiceButton_i.clicked.connect(functools.partial(self.buttonClicked, i))
+            choiceButton_i.setEnabled(self.parent().alphazero.ready)
             self.choiceButtons.append(choiceButton_i)
             choiceButton_i.show()
 
@@ -390,8 +617,29 @@ class pieceSelector(QWidget):
         self.parent().timer.start()
         self.parent().timer.timer.start(100)
         self.parent().blurPauseButton(False)
+        if self.parent().player == CurrentPlayer.HUMAN:
+            self.parent().alphazero.startPondering()
+
+    @Slot()
+    def modelReady(self):
+        for i in range(0,2):
+            self.choiceButtons[i].setEnabled(True)
+        self.update()
+
+    @Slot(str)
+    def modelError(self, message):
+        self.loadError = message
+        for i in range(0,2):
+            self.choiceButtons[i].setEnabled(False)
+        self.update()
 
     def drawPieceSelector(self):
+        if self.parent().alphazero.ready:
+            subtitle = "(GREEN goes first)"
+        elif self.loadError is not None:
+            subtitle = "(could not load the engine: " + html.escape(self.loadError) + ")"
+        else:
+            subtitle = "(loading...)"
         html_content = """
             <html>
             <body style="text-align: center; vertical-align: center;">
@@ -401,7 +649,7 @@ class pieceSelector(QWidget):
             <br>
             <div style="filter: blur(); font-family: HP Simplified JPan">
                 <p><span style="font-size: 72px; color: #ffffff;">Choose Your Piece</span></p>
-                <p><span style="font-size: 36px; color: #ffffff;">(GREEN goes first)</span></p>
+                <p><span style="font-size: 36px; color: #ffffff;">""" + subtitle + """</span></p>
             </div>
             <div style="font-size: 66px;">🟢 🔵</div>
             </body>
@@ -437,6 +685,7 @@ class pauseGame(QWidget):
         if not self.pauseFlag:
             self.parent().graphicsEffects(True)
             self.pauseButton.setText("Resume")
+            self.parent().alphazero.stopPondering()
             self.parent().timer.timer.stop()
             self.parent().undoMoveButton.undoMoveButton.setEnabled(False)
             self.parent().restartGameButton.restartGameButton.setEnabled(False)
@@ -445,6 +694,8 @@ class pauseGame(QWidget):
             self.pauseButton.setText("Pause")
             if self.parent().status == gameStatus.IN_PROGRESS:
                 self.parent().timer.timer.start()
+                if self.parent().player == CurrentPlayer.HUMAN:
+                    self.parent().alphazero.startPondering()
             self.parent().undoMoveButton.undoMoveButton.setEnabled(True)
             self.parent().restartGameButton.restartGameButton.setEnabled(True)
         self.pauseFlag = not self.pauseFlag
@@ -485,23 +736,32 @@ class alterGameState():
         self.super.status = gameStatus.NOT_STARTED
         self.super.player = CurrentPlayer.NONE
         self.super.alphazero._running = False
+        self.super.alphazero._pondering = False
         self.super.alphazero.wait()
-        self.super.board.state = np.zeros([6,7])
-        self.super.board.moveSequence = np.zeros([6,7])
+        self.super.alphazero.humanMove = None
+        if self.super.alphazero.ready:
+            self.super.alphazero.mcts.reset()
+        self.super.board.state = np.zeros([self.super.board.rows,self.super.board.columns])
+        self.super.board.moveSequence = np.zeros([self.super.board.rows,self.super.board.columns])
         self.super.board.moveCount = 0
         self.super.timer.resetTimer()
-        self.super.board.button_i_status = [True for _ in range(7)]
+        self.super.board.button_i_status = [True for _ in range(self.super.board.columns)]
+        self.super.board.refresh()
         self.super.board.toggleMoveButtons(True)
         self.super.graphicsEffects(True)
         self.super.blurPauseButton(True)
         self.super.pieceSelector.setVisible(True)
         for i in range(0,2):
-            self.super.pieceSelector.choiceButtons[i].setEnabled(True)
+            self.super.pieceSelector.choiceButtons[i].setEnabled(self.super.alphazero.ready)
 
     def undoMove(self):
         if self.super.alphazero.isRunning():
             self.super.alphazero._running = False
+            self.super.alphazero._pondering = False
             self.super.alphazero.wait()
+        self.super.alphazero.humanMove = None
+        if self.super.alphazero.ready:
+            self.super.alphazero.mcts.reset()
         last_human_move = np.where(self.super.board.moveSequence[:,:] == np.max(self.super.board.moveSequence))
         last_computer_move = np.where(self.super.board.moveSequence[:,:] == np.min(self.super.board.moveSequence))
         if self.super.board.moveSequence[last_human_move[0][0], last_human_move[1][0]] < abs(self.super.board.moveSequence[last_computer_move[0][0], last_computer_move[1][0]]):
@@ -511,7 +771,7 @@ class alterGameState():
         self.super.board.state[last_human_move[0][0], last_human_move[1][0]] = 0
         self.super.board.moveCount -= 1
         self.super.board.moveSequence[last_human_move[0][0], last_human_move[1][0]] = 0
-        self.super.board.button_i_status = [True for _ in range(7)]
+        self.super.board.button_i_status = [True for _ in range(self.super.board.columns)]
         for i in list(np.where(self.super.board.state[0, :] != 0)[0]):
             self.super.board.button_i_status[i] = False
         self.super.player = CurrentPlayer.HUMAN
@@ -520,10 +780,11 @@ class alterGameState():
             self.super.status = gameStatus.IN_PROGRESS
             self.super.timer.timer.start(100)
         self.super.timer.resetTimer()
-        self.super.board.update()
+        self.super.board.refresh()
         self.super.gameInfo.update()
         self.super.undoMoveButton.update()
         self.super.board.toggleMoveButtons(True)
+        self.super.alphazero.startPondering()
 
 class undoMoveButton(QWidget):
     def __init__(self, parent):
@@ -554,11 +815,17 @@ class mainWindow(QMainWindow):
     computerMoveSignal = Signal(dict)
     timeElapsedSignal = Signal(int)
     pauseToggleSignal = Signal(bool)
+    modelReadySignal = Signal()
+    modelErrorSignal = Signal(str)
+    searchStatsSignal = Signal(dict)
 
-    def __init__(self):
+    def __init__(self, row_count=6, column_count=7, in_a_row=4):
         super().__init__()
+        self.game = ConnectFour_Logic.ConnectFour(row_count, column_count, in_a_row)
         self.status = gameStatus.NOT_STARTED
         self.cellWidth = 80
+        self.boardWidth = (column_count + 0.5) * self.cellWidth
+        self.boardHeight = max(row_count + 1.5, 7.5) * self.cellWidth
         self.playerAction = 0
         self.player = CurrentPlayer.NONE
         self.alterGameState = alterGameState(self)
@@ -570,8 +837,8 @@ class mainWindow(QMainWindow):
         self.setGeometry(
             2.5 * self.cellWidth,
             0.5 * self.cellWidth,
-            10.5 * self.cellWidth,
-            7.5 * self.cellWidth
+            self.boardWidth + 3 * self.cellWidth,
+            self.boardHeight
         )
         self.setFixedSize(self.size())
 
@@ -591,45 +858,48 @@ class mainWindow(QMainWindow):
         self.gameOverSignal.connect(self.board.toggleMoveButtons)
         self.gameOverSignal.connect(self.gameInfo.update)
         self.pauseToggleSignal.connect(self.board.toggleMoveButtons)
+        self.modelReadySignal.connect(self.pieceSelector.modelReady)
+        self.modelErrorSignal.connect(self.pieceSelector.modelError)
+        self.searchStatsSignal.connect(self.gameInfo.showSearchStats)
 
         self.pieceSelector.setGeometry(
             0,
             0,
-            10.5 * self.cellWidth,
-            7.5 * self.cellWidth
+            self.boardWidth + 3 * self.cellWidth,
+            self.boardHeight
         )
         self.board.setGeometry(
             0,
             0,
-            7.5 * self.cellWidth,
-            7.5 * self.cellWidth
+            self.boardWidth,
+            self.boardHeight
         )
         self.timerGUI.setGeometry(
-            7.5 * self.cellWidth,
+            self.boardWidth,
             0,
             3 * self.cellWidth,
             3 * self.cellWidth
         )
         self.gameInfo.setGeometry(
-            7.5 * self.cellWidth,
+            self.boardWidth,
             3 * self.cellWidth,
             3 * self.cellWidth,
             2 * self.cellWidth
         )
         self.undoMoveButton.setGeometry(
-            7.5*self.cellWidth,
+            self.boardWidth,
             5*self.cellWidth,
             3*self.cellWidth,
             (2.5/3)*self.cellWidth
         )
         self.pauseGame.setGeometry(
-            7.5*self.cellWidth,
+            self.boardWidth,
             (5+(2.5/3))*self.cellWidth,
             3*self.cellWidth,
             (2.5/3)*self.cellWidth
         )
         self.restartGameButton.setGeometry(
-            7.5*self.cellWidth,
+            self.boardWidth,
             (5+5/3)*self.cellWidth,
             3*self.cellWidth,
             (2.5/3)*self.cellWidth
@@ -646,6 +916,7 @@ class mainWindow(QMainWindow):
         self.pauseGame.show()
         self.undoMoveButton.show()
         self.show()
+        self.alphazero.start()
 
     def blurPauseButton(self, on):
         if on:
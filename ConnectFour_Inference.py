@@ -0,0 +1,127 @@
+import numpy as np
+import torch
+import logging
+import warnings
+import torch.nn as nn
+import torch.nn.functional as F
+from torch.nn.utils.fusion import fuse_conv_bn_eval
+
+# Inference-only copy of ResNet: every BatchNorm is folded into the conv in
+# front of it, activations are kept in channels_last, and the graph is
+# scripted and frozen (or handed to torch.compile) so no Python runs per
+# layer.
+
+class FusedResBlock(nn.Module):
+    def __init__(self, resBlock):
+        super().__init__()
+        self.conv1 = fuse_conv_bn_eval(resBlock.conv1, resBlock.bn1)
+        self.conv2 = fuse_conv_bn_eval(resBlock.conv2, resBlock.bn2)
+
+    def forward(self, x):
+        residual = x
+        x = F.relu(self.conv1(x))
+        x = self.conv2(x)
+        x += residual
+        x = F.relu(x)
+        return x
+
+class FusedResNet(nn.Module):
+    def __init__(self, model):
+        super().__init__()
+        self.startBlock = nn.Sequential(
+            fuse_conv_bn_eval(model.startBlock[0], model.startBlock[1]),
+            nn.ReLU()
+        )
+        self.backBone = nn.ModuleList(
+            [FusedResBlock(resBlock) for resBlock in model.backBone]
+        )
+        self.policyHead = nn.Sequential(
+            fuse_conv_bn_eval(model.policyHead[0], model.policyHead[1]),
+            nn.ReLU(),
+            nn.Flatten(),
+            model.policyHead[4]
+        )
+        self.valueHead = nn.Sequential(
+            fuse_conv_bn_eval(model.valueHead[0], model.valueHead[1]),
+            nn.ReLU(),
+            nn.Flatten(),
+            model.valueHead[4],
+            nn.Tanh()
+        )
+
+    def forward(self, x):
+        x = self.startBlock(x)
+        for resBlock in self.backBone:
+            x = resBlock(x)
+        policy = self.policyHead(x)
+        value = self.valueHead(x)
+        return policy, value
+
+class InferenceModel:
+    def __init__(self, module, device):
+        self.module = module
+        self.device = device
+
+    def __call__(self, x):
+        with torch.inference_mode():
+            return self.module(x.contiguous(memory_format=torch.channels_last))
+
+    def eval(self):
+        return self
+
+def build_inference_model(model, game, backend="script", atol=1e-4, fallback=False):
+    # With fallback, a model that fails to build or misses the tolerance is
+    # replaced by the eager ResNet, so the optimization can never stop an
+    # app from starting; the benchmark and CLI tools still fail loudly.
+    if fallback:
+        try:
+            return build_inference_model(model, game, backend, atol)
+        except Exception as error:
+            logging.getLogger(__name__).warning("using the eager ResNet: %s", error)
+            return model.eval()
+
+    model.eval()
+    fused = FusedResNet(model).eval().to(model.device, memory_format=torch.channels_last)
+    example = torch.zeros(
+        (1, 3, game.row_count, game.column_count), device=model.device
+    ).contiguous(memory_format=torch.channels_last)
+
+    if backend == "script":
+        with warnings.catch_warnings(), torch.inference_mode():
+            # TorchScript is deprecated in recent releases but still starts
+            # far quicker than torch.compile, which matters in the GUI.
+            warnings.simplefilter("ignore", FutureWarning)
+            module = torch.jit.optimize_for_inference(torch.jit.freeze(torch.jit.script(fused)))
+    elif backend == "compile":
+        module = torch.compile(fused, dynamic=True)
+    else:
+        raise ValueError(f"Unknown inference backend: {backend}")
+    inference_model = InferenceModel(module, model.device)
+    # Run the profiling / compilation passes before the first real call.
+    inference_model(example)
+    inference_model(example)
+
+    error = get_max_error(model, inference_model, game)
+    if error > atol:
+        raise ValueError(f"Optimized model differs from the eager ResNet by {error:.2e} (tolerance {atol:.0e})")
+    return inference_model
+
+def get_sample_positions(game, num_positions, seed=0):
+    # Random playouts of up to half the board, encoded for the network.
+    rng = np.random.default_rng(seed)
+    encoded_states = np.empty((num_positions, 3, game.row_count, game.column_count), dtype=np.float32)
+    for i in range(num_positions):
+        state, _ = game.get_random_playout(rng.integers(0, game.row_count * game.column_count // 2), rng)
+        game.get_encoded_state(state, encoded_states[i])
+    return encoded_states
+
+def get_max_error(model, inference_model, game, num_positions=64, seed=0):
+    x = torch.tensor(get_sample_positions(game, num_positions, seed), device=model.device)
+
+    with torch.inference_mode():
+        policy, value = model(x)
+        fast_policy, fast_value = inference_model(x)
+    return max(
+        (policy - fast_policy).abs().max().item(),
+        (value - fast_value).abs().max().item()
+    )
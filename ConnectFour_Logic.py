@@ -1,75 +1,318 @@
 import numpy as np
+import os
+
+class BitboardState:
+    __slots__ = ("player_mask", "opponent_mask")
+
+    def __init__(self, player_mask=0, opponent_mask=0):
+        self.player_mask = player_mask
+        self.opponent_mask = opponent_mask
+
+    def __repr__(self):
+        return f"BitboardState(player_mask={self.player_mask:#x}, opponent_mask={self.opponent_mask:#x})"
+
+    def __eq__(self, other):
+        return (
+            isinstance(other, BitboardState)
+            and self.player_mask == other.player_mask
+            and self.opponent_mask == other.opponent_mask
+        )
+
+    def __hash__(self):
+        return hash((self.player_mask, self.opponent_mask))
+
+    @property
+    def mask(self):
+        return self.player_mask | self.opponent_mask
+
+    @property
+    def key(self):
+        # Unique per position: adding the mask sets one extra bit above each
+        # column's stones, so no two (player, mask) pairs share a key.
+        return self.player_mask + (self.player_mask | self.opponent_mask)
+
+    def copy(self):
+        return BitboardState(self.player_mask, self.opponent_mask)
 
 class ConnectFour:
-    def __init__(self):
-        self.row_count = 6
-        self.column_count = 7
+    # Each column takes row_count + 1 bits, bottom cell first; the spare
+    # bit on top of every column keeps shifted lines from wrapping around.
+    def __init__(self, row_count=6, column_count=7, in_a_row=4):
+        self.row_count = row_count
+        self.column_count = column_count
         self.action_size = self.column_count
-        self.in_a_row = 4
-        
+        self.in_a_row = in_a_row
+
+        self.column_height = self.row_count + 1
+        self.bottom_masks = [1 << (column * self.column_height) for column in range(self.column_count)]
+        self.column_masks = [
+            ((1 << self.row_count) - 1) << (column * self.column_height) for column in range(self.column_count)
+        ]
+        self.top_masks = [1 << (self.row_count - 1 + column * self.column_height) for column in range(self.column_count)]
+        self.board_mask = sum(self.column_masks)
+        self.top_row_mask = sum(self.top_masks)
+        self.line_shifts = (
+            1,                          # vertical
+            self.column_height,         # horizontal
+            self.column_height - 1,     # falling diagonal
+            self.column_height + 1,     # rising diagonal
+        )
+
+        self._mask_bytes = (self.column_count * self.column_height + 7) // 8
+        self._cell_bits = np.array([
+            [column * self.column_height + (self.row_count - 1 - row) for column in range(self.column_count)]
+            for row in range(self.row_count)
+        ])
+        # get_encoded_state unpacks both masks in one call, the opponent's
+        # shifted above the player's.
+        self._board_bits = self.column_count * self.column_height
+        self._encoding_bytes = (2 * self._board_bits + 7) // 8
+        self._encoding_bits = np.stack((self._cell_bits + self._board_bits, self._cell_bits))
+        self._valid_moves_cache = {}
+        self.win_lines = self._get_win_lines()
+
     def __repr__(self):
-        return "ConnectFour"
-        
+        if self.is_standard():
+            return "ConnectFour"
+        return f"ConnectFour({self.row_count}, {self.column_count}, {self.in_a_row})"
+
+    def is_standard(self):
+        return (self.row_count, self.column_count, self.in_a_row) == (6, 7, 4)
+
+    def get_variant_path(self, path):
+        # Weights and books are per geometry; the standard board keeps the
+        # plain file names.
+        if self.is_standard():
+            return path
+        root, extension = os.path.splitext(path)
+        return f"{root}_{self.row_count}x{self.column_count}_{self.in_a_row}{extension}"
+
+    def _get_win_lines(self):
+        # win_lines[bit] holds the mask of every in_a_row line through that
+        # cell, so a win check only tests the lines through the last stone.
+        win_lines = [[] for _ in range(self.column_count * self.column_height)]
+        for column in range(self.column_count):
+            for row in range(self.row_count):
+                for column_step, row_step in ((1, 0), (0, 1), (1, 1), (1, -1)):
+                    cells = [(column + column_step * i, row + row_step * i) for i in range(self.in_a_row)]
+                    if not all(0 <= c < self.column_count and 0 <= r < self.row_count for c, r in cells):
+                        continue
+                    line = sum(1 << (c * self.column_height + r) for c, r in cells)
+                    for c, r in cells:
+                        win_lines[c * self.column_height + r].append(line)
+        return [tuple(lines) for lines in win_lines]
+
     def get_initial_state(self):
-        return np.zeros((self.row_count, self.column_count))
-    
+        return BitboardState()
+
     def get_next_state(self, state, action, player):
-        row = np.max(np.where(state[:, action] == 0))
-        state[row, action] = player
+        move = (state.mask + self.bottom_masks[action]) & self.column_masks[action]
+        if player == 1:
+            state.player_mask |= move
+        else:
+            state.opponent_mask |= move
         return state
-    
+
     def get_valid_moves(self, state):
-        return (state[0] == 0).astype(np.uint8)
-    
+        filled_tops = state.mask & self.top_row_mask
+        valid_moves = self._valid_moves_cache.get(filled_tops)
+        if valid_moves is None:
+            valid_moves = np.array(
+                [filled_tops & top_mask == 0 for top_mask in self.top_masks], dtype=np.uint8
+            )
+            self._valid_moves_cache[filled_tops] = valid_moves
+        return valid_moves.copy()
+
     def check_win(self, state, action):
         if action == None:
             return False
-        
-        row = np.min(np.where(state[:, action] != 0))
-        column = action
-        player = state[row][column]
 
-        def count(offset_row, offset_column):
+        column = state.mask & self.column_masks[action]
+        if column == 0:
+            return False
+        last_bit = column.bit_length() - 1
+        position = state.player_mask if state.player_mask >> last_bit & 1 else state.opponent_mask
+        for line in self.win_lines[last_bit]:
+            if position & line == line:
+                return True
+        return False
+
+    def has_alignment(self, position):
+        for shift in self.line_shifts:
+            line = position
             for i in range(1, self.in_a_row):
-                r = row + offset_row * i
-                c = action + offset_column * i
-                if (
-                    r < 0 
-                    or r >= self.row_count
-                    or c < 0 
-                    or c >= self.column_count
-                    or state[r][c] != player
-                ):
-                    return i - 1
-            return self.in_a_row - 1
+                line &= position >> (shift * i)
+            if line:
+                return True
+        return False
 
-        return (
-            count(1, 0) >= self.in_a_row - 1 # vertical
-            or (count(0, 1) + count(0, -1)) >= self.in_a_row - 1 # horizontal
-            or (count(1, 1) + count(-1, -1)) >= self.in_a_row - 1 # top left diagonal
-            or (count(1, -1) + count(-1, 1)) >= self.in_a_row - 1 # top right diagonal
-        )
-    
     def get_value_and_terminated(self, state, action):
         if self.check_win(state, action):
             return 1, True
-        elif np.sum(self.get_valid_moves(state)) == 0:
+        elif state.mask & self.top_row_mask == self.top_row_mask:
             return 0, True
         else:
             return 0, False
-    
+
+    def get_random_playout(self, num_plies, rng):
+        # Plays up to num_plies random moves from the initial position,
+        # stopping before any move that would end the game. Returns the
+        # state, from the view of the player to move, and the moves played.
+        state = self.get_initial_state()
+        actions = []
+        for _ in range(num_plies):
+            action = int(rng.choice(np.flatnonzero(self.get_valid_moves(state))))
+            next_state = self.get_next_state(state.copy(), action, 1)
+            if self.get_value_and_terminated(next_state, action)[1]:
+                break
+            state = self.change_perspective(next_state, -1)
+            actions.append(action)
+        return state, actions
+
     def get_opponent(self, player):
         return -player
-    
+
     def get_opponent_value(self, value):
         return -value
-    
+
     def change_perspective(self, state, player):
-        return state * player
-    
-    def get_encoded_state(self, state):
-        encoded_state = np.stack(
-            (state == -1, state == 0, state == 1)
-        ).astype(np.float32)
-        
-        return encoded_state
\ No newline at end of file
+        if player == 1:
+            return state.copy()
+        return BitboardState(state.opponent_mask, state.player_mask)
+
+    def mirror_state(self, state):
+        return BitboardState(self.mirror_mask(state.player_mask), self.mirror_mask(state.opponent_mask))
+
+    def mirror_mask(self, mask):
+        mirrored = 0
+        for column in range(self.column_count):
+            shift = (self.column_count - 1 - 2 * column) * self.column_height
+            bits = mask & self.column_masks[column]
+            mirrored |= bits << shift if shift >= 0 else bits >> -shift
+        return mirrored
+
+    def get_mask_plane(self, mask):
+        bits = np.unpackbits(
+            np.frombuffer(mask.to_bytes(self._mask_bytes, "little"), dtype=np.uint8),
+            bitorder="little"
+        )
+        return bits[self._cell_bits]
+
+    def get_encoded_state(self, state, out=None):
+        # Planes: opponent, empty, player to move. Written into out when it
+        # is given, so callers can fill a preallocated batch in place.
+        if out is None:
+            out = np.empty((3, self.row_count, self.column_count), dtype=np.float32)
+        bits = np.unpackbits(
+            np.frombuffer(
+                (state.player_mask | state.opponent_mask << self._board_bits).to_bytes(self._encoding_bytes, "little"),
+                dtype=np.uint8
+            ),
+            bitorder="little"
+        )
+        planes = bits[self._encoding_bits]
+        out[::2] = planes
+        np.subtract(1, planes[0] | planes[1], out=out[1])
+        return out
+
+    def get_next_encoded_state(self, encoded_state, state, action, out=None):
+        # Planes of state, reached by playing action from the position that
+        # encoded_state holds: the players swap planes and one cell fills.
+        if out is None:
+            out = np.empty((3, self.row_count, self.column_count), dtype=np.float32)
+        row = self.row_count - (state.mask & self.column_masks[action]).bit_count()
+        out[::-1] = encoded_state
+        out[0, row, action] = 1
+        out[1, row, action] = 0
+        return out
+
+    def state_to_array(self, state):
+        return (
+            self.get_mask_plane(state.player_mask).astype(np.float64)
+            - self.get_mask_plane(state.opponent_mask)
+        )
+
+    def array_to_state(self, array):
+        array = np.asarray(array)
+        return BitboardState(
+            sum(1 << int(bit) for bit in self._cell_bits[array == 1]),
+            sum(1 << int(bit) for bit in self._cell_bits[array == -1])
+        )
+
+class BatchedConnectFour:
+    # Many boards stepped together: the same bitboard layout as ConnectFour,
+    # held as uint64 arrays with one entry per board, each board seen from
+    # the player to move. Boards whose game ends are reset in place.
+    def __init__(self, game, num_games):
+        if game.column_count * game.column_height > 64:
+            raise ValueError(f"A {game.row_count}x{game.column_count} board does not fit in 64 bits")
+        self.game = game
+        self.num_games = num_games
+        self.bottom_masks = np.array(game.bottom_masks, dtype=np.uint64)
+        self.column_masks = np.array(game.column_masks, dtype=np.uint64)
+        self.top_masks = np.array(game.top_masks, dtype=np.uint64)
+        self.top_row_mask = np.uint64(game.top_row_mask)
+        self.line_shifts = [np.uint64(shift) for shift in game.line_shifts]
+        self.cell_bits = game._cell_bits.astype(np.uint64)
+        self.player_masks = np.zeros(num_games, dtype=np.uint64)
+        self.opponent_masks = np.zeros(num_games, dtype=np.uint64)
+        self.move_counts = np.zeros(num_games, dtype=np.int32)
+
+    def reset(self, indices=None):
+        if indices is None:
+            indices = slice(None)
+        self.player_masks[indices] = 0
+        self.opponent_masks[indices] = 0
+        self.move_counts[indices] = 0
+
+    def get_state(self, index):
+        return BitboardState(int(self.player_masks[index]), int(self.opponent_masks[index]))
+
+    def set_state(self, index, state):
+        self.player_masks[index] = state.player_mask
+        self.opponent_masks[index] = state.opponent_mask
+        self.move_counts[index] = state.mask.bit_count()
+
+    def get_valid_moves(self):
+        masks = self.player_masks | self.opponent_masks
+        return ((masks[:, None] & self.top_masks[None, :]) == 0).astype(np.uint8)
+
+    def has_alignment(self, positions):
+        aligned = np.zeros(len(positions), dtype=bool)
+        for shift in self.line_shifts:
+            lines = positions.copy()
+            for i in range(1, self.game.in_a_row):
+                lines &= positions >> (shift * np.uint64(i))
+            aligned |= lines != 0
+        return aligned
+
+    def get_next_state(self, actions, auto_reset=True):
+        # Plays actions[i] on board i for the player to move. Returns the
+        # value for that player (1 for a win, 0 otherwise) and whether the
+        # game ended; finished boards are then reset when auto_reset is set.
+        actions = np.asarray(actions)
+        masks = self.player_masks | self.opponent_masks
+        moves = (masks + self.bottom_masks[actions]) & self.column_masks[actions]
+        player_masks = self.player_masks | moves
+
+        wins = self.has_alignment(player_masks)
+        draws = ~wins & (((masks | moves) & self.top_row_mask) == self.top_row_mask)
+        is_terminal = wins | draws
+        values = wins.astype(np.float32)
+
+        self.player_masks, self.opponent_masks = self.opponent_masks, player_masks
+        self.move_counts += 1
+        if auto_reset and np.any(is_terminal):
+            self.reset(is_terminal)
+        return values, is_terminal
+
+    def get_encoded_state(self):
+        # Same planes as ConnectFour.get_encoded_state: opponent, empty,
+        # player to move.
+        player_planes = (self.player_masks[:, None, None] >> self.cell_bits[None]) & np.uint64(1)
+        opponent_planes = (self.opponent_masks[:, None, None] >> self.cell_bits[None]) & np.uint64(1)
+        encoded_states = np.empty((self.num_games, 3, self.game.row_count, self.game.column_count), dtype=np.float32)
+        encoded_states[:, 0] = opponent_planes
+        encoded_states[:, 2] = player_planes
+        encoded_states[:, 1] = 1 - encoded_states[:, 0] - encoded_states[:, 2]
+        return encoded_states
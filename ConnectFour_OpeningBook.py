@@ -0,0 +1,168 @@
+import numpy as np
+import torch
+import multiprocessing as mp
+import argparse
+import os
+import time
+import ConnectFour_Logic
+import ConnectFour_AlphaZero_agent
+
+# Opening book: the visit distribution of a deep search for every position
+# up to a number of plies, stored once per mirror pair. The file is a .npy
+# open-addressing hash table keyed by BitboardState.key, so it is memory
+# mapped and a lookup touches one or two records.
+
+EMPTY_KEY = np.iinfo(np.uint64).max
+HASH_MULTIPLIER = 0x9E3779B97F4A7C15
+
+def get_book_dtype(game):
+    if game.column_count * game.column_height > 64:
+        raise ValueError(f"Positions of {game} do not fit in a 64-bit book key")
+    return np.dtype([
+        ('key', np.uint64),
+        ('best_move', np.int8),
+        ('policy', np.float16, (game.action_size,))
+    ])
+
+def _get_slot(key, bits):
+    return ((key * HASH_MULTIPLIER) & 0xFFFFFFFFFFFFFFFF) >> (64 - bits)
+
+def get_canonical_state(game, state):
+    mirrored = game.mirror_state(state)
+    if mirrored.key < state.key:
+        return mirrored, True
+    return state, False
+
+class OpeningBook:
+    def __init__(self, game, path):
+        self.game = game
+        self.records = np.load(path, mmap_mode='r')
+        if self.records.dtype != get_book_dtype(game):
+            raise ValueError(f"{path} is not an opening book for {game}")
+        self.bits = len(self.records).bit_length() - 1
+
+    def __len__(self):
+        return int(np.count_nonzero(self.records['key'] != EMPTY_KEY))
+
+    def _find(self, state):
+        state, mirrored = get_canonical_state(self.game, state)
+        slot = _get_slot(state.key, self.bits)
+        while True:
+            record = self.records[slot]
+            if record['key'] == state.key:
+                return record, mirrored
+            if record['key'] == EMPTY_KEY:
+                return None, mirrored
+            slot = (slot + 1) % len(self.records)
+
+    def lookup(self, state):
+        record, mirrored = self._find(state)
+        if record is None:
+            return None
+        policy = record['policy'].astype(np.float64)
+        return policy[::-1].copy() if mirrored else policy
+
+    def get_best_move(self, state):
+        record, mirrored = self._find(state)
+        if record is None:
+            return None
+        best_move = int(record['best_move'])
+        return self.game.action_size - 1 - best_move if mirrored else best_move
+
+def get_book_positions(game, max_plies):
+    # Every non-terminal position reachable in max_plies moves, from the
+    # view of the player to move, one per mirror pair.
+    positions = {}
+    frontier = [game.get_initial_state()]
+    for ply in range(max_plies + 1):
+        next_frontier = {}
+        for state in frontier:
+            positions[state.key] = state
+            if ply == max_plies:
+                continue
+            for action in np.flatnonzero(game.get_valid_moves(state)):
+                next_state = game.get_next_state(state.copy(), action, 1)
+                _, is_terminal = game.get_value_and_terminated(next_state, action)
+                if is_terminal:
+                    continue
+                next_state, _ = get_canonical_state(game, game.change_perspective(next_state, -1))
+                next_frontier[next_state.key] = next_state
+        frontier = list(next_frontier.values())
+    return list(positions.values())
+
+def write_book(game, path, states, policies):
+    bits = max(int(2 * len(states) - 1).bit_length(), 1)
+    records = np.zeros(1 << bits, dtype=get_book_dtype(game))
+    records['key'] = EMPTY_KEY
+    for state, policy in zip(states, policies):
+        slot = _get_slot(state.key, bits)
+        while records[slot]['key'] != EMPTY_KEY:
+            slot = (slot + 1) % len(records)
+        records[slot] = (state.key, np.argmax(policy), policy)
+
+    temporary_path = path + ".tmp.npy"
+    np.save(temporary_path, records)
+    os.replace(temporary_path, path)
+
+def _search_positions(game, args, weights_path, device, states):
+    torch.set_num_threads(args.get('threads_per_worker', 1))
+    device = torch.device(device)
+    model = ConnectFour_AlphaZero_agent.load_model(
+        game, device=device, weights_path=weights_path, num_resBlocks=args['num_resBlocks'], num_hidden=args['num_hidden']
+    )
+
+    searches = [(ConnectFour_AlphaZero_agent.MCTS(game, args, None), state) for state in states]
+    with torch.inference_mode():
+        action_probs = ConnectFour_AlphaZero_agent.run_searches(
+            model, game, searches, args['num_searches'], args.get('batch_size', 1)
+        )
+    return np.stack(action_probs)
+
+def _search_chunk(params):
+    return _search_positions(*params)
+
+def build_book(game, args, weights_path, path, max_plies, num_workers, device="cpu"):
+    states = get_book_positions(game, max_plies)
+    # Small chunks keep every worker busy and give progress as they finish.
+    chunk_size = max(min(args.get('concurrent_games', 64), len(states) // num_workers), 1)
+    chunks = [states[start:start + chunk_size] for start in range(0, len(states), chunk_size)]
+
+    start_time = time.perf_counter()
+    policies = []
+    context = mp.get_context("spawn")
+    with context.Pool(num_workers) as pool:
+        results = pool.imap(
+            _search_chunk,
+            [(game, args, weights_path, device, chunk) for chunk in chunks]
+        )
+        for chunk_policies in results:
+            policies.extend(chunk_policies)
+            print(f"{len(policies)}/{len(states)} positions searched in {time.perf_counter() - start_time:.0f}s")
+    write_book(game, path, states, policies)
+    return len(states)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Build a Connect Four opening book from deep searches.")
+    parser.add_argument("--weights", default="./ConnectFour_Weights.pt")
+    parser.add_argument("--output", default="./ConnectFour_Book.npy")
+    parser.add_argument("--plies", type=int, default=6)
+    parser.add_argument("--searches", type=int, default=8192)
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--device", default="cuda" if torch.cuda.is_available() else "cpu")
+    options = parser.parse_args()
+
+    args = {
+        'C': 2,
+        'num_searches': options.searches,
+        'dirichlet_epsilon': 0.0,
+        'dirichlet_alpha': 0.3,
+        'batch_size': 16,
+        'virtual_loss': 1,
+        'concurrent_games': 64,
+        'num_resBlocks': 9,
+        'num_hidden': 128
+    }
+    count = build_book(
+        ConnectFour_Logic.ConnectFour(), args, options.weights, options.output, options.plies, options.workers, options.device
+    )
+    print(f"{count} positions written to {options.output}")
@@ -0,0 +1,214 @@
+import numpy as np
+import torch
+import multiprocessing as mp
+import queue
+import copy
+import math
+import time
+import ConnectFour_AlphaZero_agent
+
+# Root-parallel search: every worker process grows its own tree for the same
+# position and the root visit counts are summed. Workers do not own a
+# network; they write their leaf encodings into a shared-memory slot and a
+# single inference process evaluates the pending slots of all workers in one
+# batch, writing policy logits and values back into shared memory.
+
+class RemoteModel:
+    def __init__(self, worker_id, game, requests, inputs, outputs, ready):
+        self.device = torch.device("cpu")
+        self.worker_id = worker_id
+        self.action_size = game.action_size
+        self.requests = requests
+        self.inputs = inputs
+        self.outputs = outputs
+        self.ready = ready
+
+    def __call__(self, x):
+        batch_size = len(x)
+        self.inputs[:batch_size] = x.numpy()
+        self.requests.put((self.worker_id, batch_size))
+        self.ready.wait()
+        self.ready.clear()
+        outputs = self.outputs[:batch_size].copy()
+        return torch.from_numpy(outputs[:, :self.action_size]), torch.from_numpy(outputs[:, self.action_size:])
+
+def _shared_view(raw_array, shape):
+    return np.frombuffer(raw_array, dtype=np.float32).reshape(shape)
+
+def _input_shape(game, capacity):
+    return (capacity, 3, game.row_count, game.column_count)
+
+def _output_shape(game, capacity):
+    return (capacity, game.action_size + 1)
+
+def _inference_server(game, model, device, capacity, requests, raw_inputs, raw_outputs, ready_events, batch_wait):
+    device = torch.device(device)
+    model.to(device)
+    model.device = device
+    model.eval()
+    inputs = [_shared_view(raw, _input_shape(game, capacity)) for raw in raw_inputs]
+    outputs = [_shared_view(raw, _output_shape(game, capacity)) for raw in raw_outputs]
+
+    running = True
+    while running:
+        request = requests.get()
+        if request is None:
+            break
+        pending = [request]
+        # Every worker has at most one request in flight, so wait a little
+        # for the others to fill the batch, but never longer than batch_wait.
+        deadline = time.perf_counter() + batch_wait
+        while len(pending) < len(inputs):
+            try:
+                request = requests.get(timeout=max(deadline - time.perf_counter(), 0))
+            except queue.Empty:
+                break
+            if request is None:
+                running = False
+                break
+            pending.append(request)
+
+        batch = np.concatenate([inputs[worker_id][:batch_size] for worker_id, batch_size in pending])
+        with torch.inference_mode():
+            policy, value = model(torch.from_numpy(batch).to(device))
+        evaluations = torch.cat((policy, value), dim=1).cpu().numpy()
+
+        offset = 0
+        for worker_id, batch_size in pending:
+            outputs[worker_id][:batch_size] = evaluations[offset:offset + batch_size]
+            offset += batch_size
+            ready_events[worker_id].set()
+
+def _search_worker(worker_id, game, args, capacity, commands, results, requests, raw_input, raw_output, ready, stop):
+    torch.set_num_threads(1)
+    model = RemoteModel(
+        worker_id,
+        game,
+        requests,
+        _shared_view(raw_input, _input_shape(game, capacity)),
+        _shared_view(raw_output, _output_shape(game, capacity)),
+        ready
+    )
+    cache = None
+    if 'cache_size' in args:
+        cache = ConnectFour_AlphaZero_agent.EvaluationCache(args['cache_size'])
+    mcts = ConnectFour_AlphaZero_agent.MCTS(game, args, model, cache)
+
+    while True:
+        command, *params = commands.get()
+        if command == "search":
+            state, num_searches, time_limit = params
+            action_probs = mcts.search(state, num_searches, time_limit, stop.is_set)
+            results.put((worker_id, mcts.tree.get_visit_counts(mcts.root), action_probs))
+        elif command == "advance":
+            mcts.advance(params[0])
+        elif command == "reset":
+            mcts.reset()
+        elif command == "close":
+            break
+
+class ParallelMCTS:
+    def __init__(self, game, args, model, num_workers):
+        self.game = game
+        self.args = args
+        self.num_workers = num_workers
+
+        # Identical workers would grow identical trees, so each one mixes
+        # its own Dirichlet noise into the root priors.
+        worker_args = dict(args)
+        worker_args['dirichlet_epsilon'] = max(args['dirichlet_epsilon'], args.get('worker_dirichlet_epsilon', 0.1))
+        capacity = args.get('batch_size', 1)
+
+        context = mp.get_context("spawn")
+        self.requests = context.Queue()
+        self.results = context.Queue()
+        self.stop = context.Event()
+        self.commands = [context.Queue() for _ in range(num_workers)]
+        # Held on self: spawned children unpickle these after start() returns.
+        self.ready_events = [context.Event() for _ in range(num_workers)]
+        self.raw_inputs = [context.RawArray('f', math.prod(_input_shape(game, capacity))) for _ in range(num_workers)]
+        self.raw_outputs = [context.RawArray('f', math.prod(_output_shape(game, capacity))) for _ in range(num_workers)]
+
+        server_model = copy.deepcopy(model).cpu()
+        self.server = context.Process(
+            target=_inference_server,
+            args=(
+                game, server_model, str(model.device), capacity, self.requests,
+                self.raw_inputs, self.raw_outputs, self.ready_events, args.get('inference_batch_wait', 0.001)
+            ),
+            daemon=True
+        )
+        self.server.start()
+
+        self.workers = []
+        for worker_id in range(num_workers):
+            worker = context.Process(
+                target=_search_worker,
+                args=(
+                    worker_id, game, worker_args, capacity, self.commands[worker_id], self.results,
+                    self.requests, self.raw_inputs[worker_id], self.raw_outputs[worker_id], self.ready_events[worker_id], self.stop
+                ),
+                daemon=True
+            )
+            worker.start()
+            self.workers.append(worker)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _check_processes(self):
+        # Workers and the server only exit on close(), so a dead one would
+        # leave search() waiting for results that never come.
+        for process in [self.server] + self.workers:
+            if not process.is_alive():
+                for other in [self.server] + self.workers:
+                    if other.is_alive():
+                        other.terminate()
+                raise RuntimeError(f"{process.name} exited with code {process.exitcode}")
+
+    def _broadcast(self, *command):
+        for commands in self.commands:
+            commands.put(command)
+
+    def search(self, state, num_searches=None, time_limit=None, should_stop=None):
+        if num_searches is None:
+            num_searches = self.args['num_searches']
+        if time_limit is None:
+            time_limit = self.args.get('time_limit')
+
+        self.stop.clear()
+        self._broadcast("search", state, math.ceil(num_searches / self.num_workers), time_limit)
+
+        visit_counts = np.zeros(self.game.action_size)
+        action_probs = np.zeros(self.game.action_size)
+        for _ in range(self.num_workers):
+            while True:
+                try:
+                    _, worker_visit_counts, worker_action_probs = self.results.get(timeout=0.01)
+                    break
+                except queue.Empty:
+                    self._check_processes()
+                    if should_stop is not None and should_stop():
+                        self.stop.set()
+            visit_counts += worker_visit_counts
+            action_probs += worker_action_probs
+
+        if np.sum(visit_counts) == 0:
+            return action_probs / np.sum(action_probs)
+        return visit_counts / np.sum(visit_counts)
+
+    def advance(self, action):
+        self._broadcast("advance", action)
+
+    def reset(self):
+        self._broadcast("reset")
+
+    def close(self):
+        self._broadcast("close")
+        for worker in self.workers:
+            worker.join()
+        self.requests.put(None)
+        self.server.join()
@@ -0,0 +1,156 @@
+import torch
+import torch.nn as nn
+import torch.ao.quantization as quantization
+import argparse
+import copy
+import json
+import time
+import warnings
+import ConnectFour_Logic
+import ConnectFour_AlphaZero_agent
+import ConnectFour_Arena
+import ConnectFour_Inference
+
+# INT8 copy of ResNet for CPU play, built by static post-training
+# quantization: conv+BN(+ReLU) are fused, observers are calibrated on sample
+# positions and every conv and linear layer runs in int8. Only the final tanh
+# of the value head stays in float.
+
+class QuantizedResBlock(nn.Module):
+    def __init__(self, resBlock):
+        super().__init__()
+        self.conv1 = resBlock.conv1
+        self.bn1 = resBlock.bn1
+        self.relu = nn.ReLU()
+        self.conv2 = resBlock.conv2
+        self.bn2 = resBlock.bn2
+        self.add_relu = nn.quantized.FloatFunctional()
+
+    def forward(self, x):
+        residual = x
+        x = self.relu(self.bn1(self.conv1(x)))
+        x = self.bn2(self.conv2(x))
+        return self.add_relu.add_relu(x, residual)
+
+    def fuse(self):
+        quantization.fuse_modules(self, [['conv1', 'bn1', 'relu'], ['conv2', 'bn2']], inplace=True)
+
+class QuantizedResNet(nn.Module):
+    def __init__(self, model):
+        super().__init__()
+        model = copy.deepcopy(model).cpu().eval()
+        self.device = torch.device("cpu")
+        self.quant = quantization.QuantStub()
+        self.startBlock = model.startBlock
+        self.backBone = nn.ModuleList(
+            [QuantizedResBlock(resBlock) for resBlock in model.backBone]
+        )
+        self.policyHead = model.policyHead
+        self.policyDequant = quantization.DeQuantStub()
+        self.valueHead = model.valueHead[:5]
+        self.valueDequant = quantization.DeQuantStub()
+        self.tanh = nn.Tanh()
+
+    def forward(self, x):
+        x = self.quant(x)
+        x = self.startBlock(x)
+        for resBlock in self.backBone:
+            x = resBlock(x)
+        policy = self.policyDequant(self.policyHead(x))
+        value = self.tanh(self.valueDequant(self.valueHead(x)))
+        return policy, value
+
+    def fuse(self):
+        quantization.fuse_modules(self.startBlock, [['0', '1', '2']], inplace=True)
+        for resBlock in self.backBone:
+            resBlock.fuse()
+        quantization.fuse_modules(self.policyHead, [['0', '1', '2']], inplace=True)
+        quantization.fuse_modules(self.valueHead, [['0', '1', '2']], inplace=True)
+
+def quantize_model(model, game, num_calibration_positions=1024, backend="x86", calibration_batch_size=64):
+    torch.backends.quantized.engine = backend
+    quantized = QuantizedResNet(model).eval()
+    positions = torch.tensor(ConnectFour_Inference.get_sample_positions(game, num_calibration_positions))
+    with warnings.catch_warnings():
+        # Eager-mode quantization is deprecated in recent releases, but its
+        # replacement is a separate package we do not depend on.
+        warnings.simplefilter("ignore", DeprecationWarning)
+        warnings.simplefilter("ignore", UserWarning)
+        quantized.fuse()
+        quantized.qconfig = quantization.get_default_qconfig(backend)
+        quantization.prepare(quantized, inplace=True)
+        with torch.inference_mode():
+            for start in range(0, len(positions), calibration_batch_size):
+                quantized(positions[start:start + calibration_batch_size])
+        quantization.convert(quantized, inplace=True)
+    return quantized
+
+def load_quantized_model(game, weights_path, num_resBlocks=9, num_hidden=128, backend="x86"):
+    # Quantizes straight from the float weights file, so there is no second
+    # artifact to keep in sync with ConnectFour_Weights.pt.
+    model = ConnectFour_AlphaZero_agent.load_model(
+        game, weights_path=weights_path, num_resBlocks=num_resBlocks, num_hidden=num_hidden
+    )
+    return quantize_model(model, game, backend=backend)
+
+def get_latency(model, game, batch_size, repeats=50):
+    x = torch.tensor(ConnectFour_Inference.get_sample_positions(game, batch_size, seed=1))
+    with torch.inference_mode():
+        for _ in range(5):
+            model(x)
+        start_time = time.perf_counter()
+        for _ in range(repeats):
+            model(x)
+    return (time.perf_counter() - start_time) / repeats
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Compare the INT8 ResNet with the float model.")
+    parser.add_argument("--weights", default="./ConnectFour_Weights.pt")
+    parser.add_argument("--output", default="./quantization.json")
+    parser.add_argument("--resblocks", type=int, default=9)
+    parser.add_argument("--hidden", type=int, default=128)
+    parser.add_argument("--games", type=int, default=20)
+    parser.add_argument("--searches", type=int, default=200)
+    parser.add_argument("--threads", type=int, default=1)
+    options = parser.parse_args()
+
+    torch.set_num_threads(options.threads)
+    game = ConnectFour_Logic.ConnectFour()
+    model = ConnectFour_AlphaZero_agent.load_model(
+        game, weights_path=options.weights, num_resBlocks=options.resblocks, num_hidden=options.hidden
+    )
+    quantized = quantize_model(model, game)
+
+    positions = torch.tensor(ConnectFour_Inference.get_sample_positions(game, 512, seed=2))
+    with torch.inference_mode():
+        policy, value = model(positions)
+        quantized_policy, quantized_value = quantized(positions)
+    report = {
+        'weights': options.weights,
+        'policy_agreement': (policy.argmax(dim=1) == quantized_policy.argmax(dim=1)).float().mean().item(),
+        'max_value_error': (value - quantized_value).abs().max().item(),
+        'latency_ms': {}
+    }
+    print(f"policy top-1 agreement {report['policy_agreement']:.1%}, max value error {report['max_value_error']:.4f}")
+
+    for batch_size in (1, 16, 64):
+        float_latency = get_latency(model, game, batch_size)
+        quantized_latency = get_latency(quantized, game, batch_size)
+        report['latency_ms'][batch_size] = {'float': float_latency * 1000, 'int8': quantized_latency * 1000}
+        print(
+            f"batch {batch_size:3d}: float {float_latency * 1000:.2f} ms, int8 {quantized_latency * 1000:.2f} ms "
+            f"({float_latency / quantized_latency:.2f}x)"
+        )
+
+    config = {'num_searches': options.searches, 'batch_size': 8}
+    results = ConnectFour_Arena.play_match(
+        game,
+        ConnectFour_Arena.Engine(game, config, quantized),
+        ConnectFour_Arena.Engine(game, config, model),
+        options.games
+    )
+    report['match'] = results
+    print(f"int8 vs float over {options.games} games: +{results['wins']} ={results['draws']} -{results['losses']}")
+
+    with open(options.output, "w") as file:
+        json.dump(report, file, indent=4)
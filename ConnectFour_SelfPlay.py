@@ -0,0 +1,234 @@
+import numpy as np
+import torch
+import multiprocessing as mp
+import argparse
+import os
+import queue
+import time
+import ConnectFour_Logic
+import ConnectFour_AlphaZero_agent
+
+# Headless self-play. Every worker process plays many games at once: each
+# game owns an MCTS, and on every round the pending leaves of all games are
+# evaluated by the worker's network in one batch. Finished games are written
+# as fixed-size (encoded state, MCTS policy, outcome) records to shards of
+# raw binary that are renamed into place once complete.
+
+def get_sample_dtype(game):
+    return np.dtype([
+        ('state', np.uint8, (3, game.row_count, game.column_count)),
+        ('policy', np.float32, (game.action_size,)),
+        ('value', np.float32)
+    ])
+
+class SampleWriter:
+    def __init__(self, directory, prefix, dtype, shard_size):
+        self.directory = directory
+        self.prefix = prefix
+        self.dtype = dtype
+        self.shard_size = shard_size
+        self.shard_index = 0
+        self.shard_count = 0
+        self.file = None
+        os.makedirs(directory, exist_ok=True)
+
+    def _shard_path(self, suffix):
+        return os.path.join(self.directory, f"{self.prefix}-{self.shard_index:05d}{suffix}")
+
+    def write(self, samples):
+        while len(samples) > 0:
+            if self.file is None:
+                self.file = open(self._shard_path(".tmp"), "wb")
+                self.shard_count = 0
+            count = min(len(samples), self.shard_size - self.shard_count)
+            samples[:count].tofile(self.file)
+            self.file.flush()
+            self.shard_count += count
+            samples = samples[count:]
+            if self.shard_count == self.shard_size:
+                self._finish_shard()
+
+    def _finish_shard(self):
+        self.file.close()
+        self.file = None
+        os.replace(self._shard_path(".tmp"), self._shard_path(".bin"))
+        self.shard_index += 1
+
+    def close(self):
+        if self.file is not None:
+            self._finish_shard()
+
+class SelfPlayGame:
+    def __init__(self, game, args):
+        self.game = game
+        self.args = args
+        self.state = game.get_initial_state()
+        self.mcts = ConnectFour_AlphaZero_agent.MCTS(game, args, None)
+        self.memory = []
+
+    def choose_action(self, action_probs):
+        if len(self.memory) <= self.args['temperature_moves']:
+            action_probs = action_probs ** (1 / self.args['temperature'])
+            return np.random.choice(self.game.action_size, p=action_probs / np.sum(action_probs))
+        return int(np.argmax(action_probs))
+
+    def play(self, action_probs):
+        self.memory.append((self.game.get_encoded_state(self.state), action_probs))
+        action = self.choose_action(action_probs)
+        next_state = self.game.get_next_state(self.state.copy(), action, 1)
+        value, is_terminal = self.game.get_value_and_terminated(next_state, action)
+        if is_terminal:
+            return value
+        self.state = self.game.change_perspective(next_state, -1)
+        self.mcts.advance(action)
+        return None
+
+    def get_samples(self, value, dtype):
+        # value is from the view of the player who made the last move; the
+        # records alternate between the two players going backwards.
+        samples = np.zeros(len(self.memory), dtype=dtype)
+        for i, (encoded_state, action_probs) in enumerate(reversed(self.memory)):
+            samples[len(self.memory) - 1 - i] = (
+                encoded_state,
+                action_probs,
+                value if i % 2 == 0 else self.game.get_opponent_value(value)
+            )
+        return samples
+
+def _self_play_worker(worker_id, game, args, weights_path, device, output_dir, num_games, progress):
+    torch.set_num_threads(args.get('threads_per_worker', 1))
+    np.random.seed((time.time_ns() + worker_id) % 2**32)
+    device = torch.device(device)
+    model = ConnectFour_AlphaZero_agent.load_model(
+        game, device=device, weights_path=weights_path, num_resBlocks=args['num_resBlocks'], num_hidden=args['num_hidden']
+    )
+
+    dtype = get_sample_dtype(game)
+    writer = SampleWriter(output_dir, f"selfplay-{time.time_ns()}-{worker_id:03d}", dtype, args['shard_size'])
+    games = [SelfPlayGame(game, args) for _ in range(min(args['concurrent_games'], num_games))]
+    games_started = len(games)
+
+    with torch.inference_mode():
+        while len(games) > 0:
+            action_probs = ConnectFour_AlphaZero_agent.run_searches(
+                model,
+                game,
+                [(self_play_game.mcts, self_play_game.state) for self_play_game in games],
+                args['num_searches'],
+                args.get('batch_size', 1)
+            )
+            for self_play_game, probs in zip(list(games), action_probs):
+                value = self_play_game.play(probs)
+                if value is None:
+                    continue
+                samples = self_play_game.get_samples(value, dtype)
+                writer.write(samples)
+                progress.put((worker_id, len(samples)))
+                games.remove(self_play_game)
+                if games_started < num_games:
+                    games.append(SelfPlayGame(game, args))
+                    games_started += 1
+
+    writer.close()
+    progress.put((worker_id, None))
+
+def get_from_workers(results, workers, poll_interval=1.0):
+    # results.get(), but raises instead of blocking forever once a worker has
+    # died; a worker that crashes never sends what the parent waits for.
+    while True:
+        try:
+            return results.get(timeout=poll_interval)
+        except queue.Empty:
+            for worker in workers:
+                if worker.exitcode is not None and worker.exitcode != 0:
+                    for other in workers:
+                        if other.is_alive():
+                            other.terminate()
+                    raise RuntimeError(f"{worker.name} exited with code {worker.exitcode}")
+
+class SelfPlay:
+    def __init__(self, game, args, weights_path, output_dir, device="cpu"):
+        self.game = game
+        self.args = args
+        self.weights_path = weights_path
+        self.output_dir = output_dir
+        self.device = device
+
+    def run(self, num_games, num_workers, report_interval=10):
+        context = mp.get_context("spawn")
+        progress = context.Queue()
+        games_per_worker = [num_games // num_workers + (i < num_games % num_workers) for i in range(num_workers)]
+        workers = [
+            context.Process(
+                target=_self_play_worker,
+                args=(
+                    worker_id, self.game, self.args, self.weights_path, self.device,
+                    self.output_dir, games_per_worker[worker_id], progress
+                ),
+                daemon=True
+            )
+            for worker_id in range(num_workers) if games_per_worker[worker_id] > 0
+        ]
+        for worker in workers:
+            worker.start()
+
+        start_time = time.perf_counter()
+        last_report = start_time
+        games = 0
+        samples = 0
+        running = len(workers)
+        while running > 0:
+            _, num_samples = get_from_workers(progress, workers)
+            if num_samples is None:
+                running -= 1
+            else:
+                games += 1
+                samples += num_samples
+            now = time.perf_counter()
+            if now - last_report >= report_interval:
+                elapsed = now - start_time
+                print(f"{games}/{num_games} games, {games / elapsed:.2f} games/sec, {samples / elapsed:.1f} samples/sec")
+                last_report = now
+        for worker in workers:
+            worker.join()
+
+        elapsed = time.perf_counter() - start_time
+        return {
+            'games': games,
+            'samples': samples,
+            'seconds': elapsed,
+            'games_per_sec': games / elapsed,
+            'samples_per_sec': samples / elapsed
+        }
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Generate Connect Four self-play training data.")
+    parser.add_argument("--weights", default="./ConnectFour_Weights.pt")
+    parser.add_argument("--output", default="./selfplay")
+    parser.add_argument("--games", type=int, default=1000)
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--concurrent-games", type=int, default=64)
+    parser.add_argument("--searches", type=int, default=600)
+    parser.add_argument("--device", default="cuda" if torch.cuda.is_available() else "cpu")
+    options = parser.parse_args()
+
+    args = {
+        'C': 2,
+        'num_searches': options.searches,
+        'dirichlet_epsilon': 0.25,
+        'dirichlet_alpha': 0.3,
+        'batch_size': 8,
+        'temperature': 1.25,
+        'temperature_moves': 15,
+        'concurrent_games': options.concurrent_games,
+        'shard_size': 2**16,
+        'num_resBlocks': 9,
+        'num_hidden': 128
+    }
+    stats = SelfPlay(ConnectFour_Logic.ConnectFour(), args, options.weights, options.output, options.device).run(
+        options.games, options.workers
+    )
+    print(
+        f"{stats['games']} games, {stats['samples']} samples in {stats['seconds']:.1f}s: "
+        f"{stats['games_per_sec']:.2f} games/sec, {stats['samples_per_sec']:.1f} samples/sec"
+    )
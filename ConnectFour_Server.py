@@ -0,0 +1,402 @@
+import numpy as np
+import torch
+import asyncio
+import argparse
+import collections
+import concurrent.futures
+import json
+import logging
+import time
+import ConnectFour_Logic
+import ConnectFour_AlphaZero_agent
+
+# Headless server hosting many games against the engine at once. Clients send
+# newline-delimited JSON requests over a local TCP socket:
+#   {"op": "new", "engine_first": false, "num_searches": 800, "time_limit": 1.0}
+#   {"op": "move", "game": 0, "action": 3}
+#   {"op": "close", "game": 0}
+#   {"op": "metrics"}
+# and get one JSON line back per request, carrying the request's "id" if it
+# had one. Every game owns its own search tree, but none owns a network: the
+# leaves of all running searches are queued on one InferenceBatcher, which
+# evaluates them together once max_batch_size positions are waiting or the
+# oldest has waited max_wait seconds.
+
+DEFAULT_ARGS = {
+    'C': 2,
+    'num_searches': 800,
+    'time_limit': None,
+    'dirichlet_epsilon': 0.0,
+    'dirichlet_alpha': 0.3,
+    'batch_size': 8,
+    'virtual_loss': 1,
+    'cache_size': 2**18
+}
+
+def _percentile(values, q):
+    return float(np.percentile(values, q)) if len(values) > 0 else 0.0
+
+class InferenceBatcher:
+    def __init__(self, game, model, max_batch_size=256, max_wait=0.002):
+        self.game = game
+        self.model = model
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.pending = collections.deque()
+        self.pending_positions = 0
+        self.request_event = asyncio.Event()
+        self.full_event = asyncio.Event()
+        # The model runs on its own thread so the event loop keeps selecting
+        # leaves for the other games while a batch is evaluated.
+        self.executor = concurrent.futures.ThreadPoolExecutor(1)
+        self.inputs = torch.empty(
+            (max_batch_size, 3, game.row_count, game.column_count),
+            dtype=torch.float32,
+            pin_memory=model.device.type == "cuda"
+        )
+        self.batches = 0
+        self.positions = 0
+        self.queue_depths = collections.deque(maxlen=10000)
+
+    async def evaluate(self, encoded_states):
+        # encoded_states must stay unchanged until the result is back.
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self.pending.append((encoded_states, future, loop.time()))
+        self.pending_positions += len(encoded_states)
+        self.request_event.set()
+        if self.pending_positions >= self.max_batch_size:
+            self.full_event.set()
+        return await future
+
+    def _run_model(self, encoded_states):
+        with torch.inference_mode():
+            policy_logits, values = self.model(encoded_states.to(self.model.device, non_blocking=True))
+        return policy_logits.cpu().numpy(), values.squeeze(1).cpu().numpy()
+
+    def _take_batch(self):
+        requests = []
+        positions = 0
+        while len(self.pending) > 0 and (positions == 0 or positions + len(self.pending[0][0]) <= self.max_batch_size):
+            encoded_states, future, _ = self.pending.popleft()
+            self.pending_positions -= len(encoded_states)
+            if future.cancelled():
+                continue
+            requests.append((encoded_states, future))
+            positions += len(encoded_states)
+        if len(self.pending) == 0:
+            self.request_event.clear()
+        if self.pending_positions < self.max_batch_size:
+            self.full_event.clear()
+        return requests
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            await self.request_event.wait()
+            # The deadline belongs to the oldest request still queued, so
+            # requests left over from a full batch do not wait again.
+            remaining = self.pending[0][2] + self.max_wait - loop.time()
+            if remaining > 0 and not self.full_event.is_set():
+                try:
+                    await asyncio.wait_for(self.full_event.wait(), remaining)
+                except asyncio.TimeoutError:
+                    pass
+
+            self.queue_depths.append(self.pending_positions)
+            requests = self._take_batch()
+            if len(requests) == 0:
+                continue
+            # A single request may exceed max_batch_size when it is the only
+            # one taken.
+            positions = sum(len(encoded_states) for encoded_states, _ in requests)
+            if positions > len(self.inputs):
+                self.inputs = torch.empty(
+                    (positions,) + tuple(self.inputs.shape[1:]), dtype=torch.float32, pin_memory=self.inputs.is_pinned()
+                )
+            input_buffer = self.inputs.numpy()
+            offset = 0
+            for encoded_states, _ in requests:
+                input_buffer[offset:offset + len(encoded_states)] = encoded_states
+                offset += len(encoded_states)
+            try:
+                policy_logits, values = await loop.run_in_executor(self.executor, self._run_model, self.inputs[:positions])
+            except Exception as error:
+                for _, future in requests:
+                    if not future.done():
+                        future.set_exception(error)
+                continue
+            self.batches += 1
+            self.positions += positions
+
+            offset = 0
+            for encoded_states, future in requests:
+                if not future.done():
+                    future.set_result((
+                        policy_logits[offset:offset + len(encoded_states)],
+                        values[offset:offset + len(encoded_states)]
+                    ))
+                offset += len(encoded_states)
+
+class GameSession:
+    def __init__(self, game, args, cache, engine_first):
+        self.game = game
+        self.args = args
+        # The model is never called directly; leaves go through the batcher.
+        self.mcts = ConnectFour_AlphaZero_agent.MCTS(game, args, None, cache)
+        self.state = game.get_initial_state()
+        # 1 while the first player is to move; state is always from the view
+        # of the player to move.
+        self.player = 1
+        self.engine_player = 1 if engine_first else -1
+        self.moves = []
+        self.result = None
+        self.busy = False
+
+    def get_board(self):
+        return (self.game.state_to_array(self.state) * self.player).astype(int).tolist()
+
+    def play(self, action):
+        self.state = self.game.get_next_state(self.state, action, 1)
+        self.moves.append(action)
+        value, is_terminal = self.game.get_value_and_terminated(self.state, action)
+        if is_terminal:
+            self.result = self.player * value
+        self.state = self.game.change_perspective(self.state, -1)
+        self.player = -self.player
+        self.mcts.advance(action)
+
+    def get_result(self):
+        # Result from the client's view.
+        if self.result is None:
+            return None
+        if self.result == 0:
+            return "draw"
+        return "loss" if self.result == self.engine_player else "win"
+
+class GameServer:
+    def __init__(self, game, model, args, max_batch_size=256, max_wait=0.002, max_searches=None):
+        self.game = game
+        self.args = dict(DEFAULT_ARGS, **args)
+        self.max_searches = max_searches if max_searches is not None else self.args['num_searches']
+        self.batcher = InferenceBatcher(game, model, max_batch_size, max_wait)
+        # Positions repeat across games, so one cache serves all of them.
+        self.cache = ConnectFour_AlphaZero_agent.EvaluationCache(self.args['cache_size'])
+        self.games = {}
+        self.next_game_id = 0
+        self.moves = 0
+        self.move_latencies = collections.deque(maxlen=10000)
+        self.start_time = time.perf_counter()
+
+    async def search(self, session):
+        mcts = session.mcts
+        tree = mcts.tree
+        root = mcts.set_root(session.state)
+        batch_size = session.args['batch_size']
+        searches_left = session.args['num_searches'] - (tree.visit_count[root] - 1)
+        time_limit = session.args['time_limit']
+        start_time = time.perf_counter()
+
+        while not tree.is_fully_expanded(root) or searches_left > 0:
+            if tree.is_fully_expanded(root):
+                if time_limit is not None and time.perf_counter() - start_time >= time_limit:
+                    break
+                leaves, simulations = mcts.select_leaves(min(batch_size, searches_left))
+                searches_left -= simulations
+            else:
+                leaves, _ = mcts.select_leaves(1)
+            if len(leaves) > 0:
+                mcts.backup_leaves(leaves, *await self.batcher.evaluate(mcts.input_buffer[:len(leaves)]))
+            else:
+                # Every leaf was terminal or cached; let the other games run.
+                await asyncio.sleep(0)
+        return tree.get_action_probs(root)
+
+    async def engine_move(self, session):
+        start_time = time.perf_counter()
+        action_probs = await self.search(session)
+        action = int(np.argmax(action_probs))
+        session.play(action)
+        self.moves += 1
+        self.move_latencies.append(time.perf_counter() - start_time)
+        return action
+
+    def _get_session(self, request):
+        session = self.games.get(request.get('game'))
+        if session is None:
+            raise ValueError(f"unknown game {request.get('game')}")
+        return session
+
+    async def new_game(self, request, owned_games):
+        num_searches = min(int(request.get('num_searches', self.args['num_searches'])), self.max_searches)
+        time_limit = request.get('time_limit', self.args['time_limit'])
+        if time_limit is not None and (
+            isinstance(time_limit, bool) or not isinstance(time_limit, (int, float)) or not time_limit > 0
+        ):
+            raise ValueError(f"invalid time_limit {time_limit!r}")
+        args = dict(self.args, num_searches=max(num_searches, 1), time_limit=time_limit)
+        session = GameSession(self.game, args, self.cache, bool(request.get('engine_first', False)))
+        game_id = self.next_game_id
+        self.next_game_id += 1
+        self.games[game_id] = session
+        owned_games.add(game_id)
+
+        response = {'game': game_id, 'action': None}
+        if session.engine_player == 1:
+            session.busy = True
+            try:
+                response['action'] = await self.engine_move(session)
+            finally:
+                session.busy = False
+        response['board'] = session.get_board()
+        return response
+
+    async def move(self, request):
+        session = self._get_session(request)
+        if session.busy:
+            raise ValueError("the engine is still thinking")
+        if session.result is not None:
+            raise ValueError("the game is over")
+        action = request.get('action')
+        if not isinstance(action, int) or not 0 <= action < self.game.action_size \
+                or not self.game.get_valid_moves(session.state)[action]:
+            raise ValueError(f"invalid move {action}")
+
+        session.play(action)
+        response = {'action': None}
+        if session.result is None:
+            session.busy = True
+            try:
+                response['action'] = await self.engine_move(session)
+            finally:
+                session.busy = False
+        response['board'] = session.get_board()
+        response['result'] = session.get_result()
+        return response
+
+    def get_metrics(self):
+        batcher = self.batcher
+        latencies = list(self.move_latencies)
+        queue_depths = list(batcher.queue_depths)
+        elapsed = time.perf_counter() - self.start_time
+        return {
+            'games': len(self.games),
+            'moves': self.moves,
+            'move_latency_p50': _percentile(latencies, 50),
+            'move_latency_p99': _percentile(latencies, 99),
+            'queue_depth': batcher.pending_positions,
+            'queue_depth_p50': _percentile(queue_depths, 50),
+            'queue_depth_p99': _percentile(queue_depths, 99),
+            'batches': batcher.batches,
+            'mean_batch_size': batcher.positions / batcher.batches if batcher.batches > 0 else 0.0,
+            'positions_per_sec': batcher.positions / elapsed if elapsed > 0 else 0.0,
+            'cache': self.cache.get_stats()
+        }
+
+    async def handle_request(self, request, owned_games):
+        op = request.get('op')
+        if op == "new":
+            return await self.new_game(request, owned_games)
+        if op == "move":
+            return await self.move(request)
+        if op == "close":
+            self._get_session(request)
+            del self.games[request['game']]
+            owned_games.discard(request['game'])
+            return {}
+        if op == "metrics":
+            return self.get_metrics()
+        raise ValueError(f"unknown op {op}")
+
+    async def _respond(self, line, writer, owned_games):
+        request_id = None
+        try:
+            request = json.loads(line)
+            request_id = request.get('id')
+            response = dict(await self.handle_request(request, owned_games), ok=True)
+        except (ValueError, KeyError, TypeError, AttributeError) as error:
+            response = {'ok': False, 'error': str(error)}
+        except Exception as error:
+            # A failed batch or search must still answer the request, or the
+            # client waits on its id forever.
+            logging.getLogger(__name__).exception("request failed: %r", line)
+            response = {'ok': False, 'error': f"{type(error).__name__}: {error}"}
+        if request_id is not None:
+            response['id'] = request_id
+        writer.write(json.dumps(response).encode() + b"\n")
+        await writer.drain()
+
+    async def _handle_connection(self, reader, writer):
+        # Requests on one connection run concurrently, so a client can play
+        # many games over it; the games are dropped when it disconnects.
+        owned_games = set()
+        tasks = set()
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                task = asyncio.create_task(self._respond(line, writer, owned_games))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+            if tasks:
+                await asyncio.gather(*tasks, return_exceptions=True)
+        except ConnectionError:
+            pass
+        finally:
+            for game_id in owned_games:
+                self.games.pop(game_id, None)
+            writer.close()
+
+    async def serve(self, host="127.0.0.1", port=8765, report_interval=None):
+        batcher_task = asyncio.create_task(self.batcher.run())
+        server = await asyncio.start_server(self._handle_connection, host, port)
+        try:
+            async with server:
+                if report_interval is None:
+                    await server.serve_forever()
+                while True:
+                    await asyncio.sleep(report_interval)
+                    metrics = self.get_metrics()
+                    print(
+                        f"{metrics['games']} games, {metrics['moves']} moves, "
+                        f"latency p50 {metrics['move_latency_p50'] * 1000:.0f} ms p99 {metrics['move_latency_p99'] * 1000:.0f} ms, "
+                        f"queue depth {metrics['queue_depth']}, mean batch {metrics['mean_batch_size']:.1f}"
+                    )
+        finally:
+            batcher_task.cancel()
+            self.batcher.executor.shutdown()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Serve many concurrent Connect Four games from one shared network.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--tier", default="full", choices=list(ConnectFour_AlphaZero_agent.NETWORK_TIERS))
+    parser.add_argument("--optimize-inference", action="store_true")
+    parser.add_argument("--searches", type=int, default=800, help="default search budget per move")
+    parser.add_argument("--max-searches", type=int, default=4096, help="largest budget a game may ask for")
+    parser.add_argument("--time-limit", type=float, default=None, help="default seconds per move")
+    parser.add_argument("--max-batch-size", type=int, default=256)
+    parser.add_argument("--max-wait", type=float, default=0.002, help="seconds a leaf may wait for its batch to fill")
+    parser.add_argument("--report-interval", type=float, default=10)
+    parser.add_argument("--rows", type=int, default=6)
+    parser.add_argument("--columns", type=int, default=7)
+    parser.add_argument("--in-a-row", type=int, default=4)
+    parser.add_argument("--device", default="cuda" if torch.cuda.is_available() else "cpu")
+    options = parser.parse_args()
+
+    game = ConnectFour_Logic.ConnectFour(options.rows, options.columns, options.in_a_row)
+    model = ConnectFour_AlphaZero_agent.load_model(game, options.tier, torch.device(options.device))
+    if options.optimize_inference:
+        import ConnectFour_Inference
+        model = ConnectFour_Inference.build_inference_model(model, game)
+    server = GameServer(
+        game,
+        model,
+        {'num_searches': options.searches, 'time_limit': options.time_limit},
+        options.max_batch_size,
+        options.max_wait,
+        options.max_searches
+    )
+    print(f"serving {game} on {options.host}:{options.port}")
+    asyncio.run(server.serve(options.host, options.port, options.report_interval))
@@ -0,0 +1,179 @@
+import numpy as np
+import argparse
+import sys
+
+# Exact negamax/alpha-beta solver on BitboardState. A score is positive when
+# the player to move wins, larger for quicker wins: winning with the n-th
+# stone of the game scores (board_size + 2 - n) // 2, so even a win with the
+# last stone scores 1, and a draw is 0.
+# Searches are iteratively deepened so a quick forced win is found without
+# searching the whole tree; a depth-limited search scores the horizon as 0,
+# so any nonzero result is already proven.
+
+EXACT = 0
+LOWER_BOUND = 1
+UPPER_BOUND = 2
+
+class Solver:
+    def __init__(self, game, table_size=2**18):
+        self.game = game
+        self.table_size = table_size
+        self.table = {}
+        self.board_size = game.row_count * game.column_count
+        center = (game.column_count - 1) / 2
+        self.move_order = sorted(range(game.column_count), key=lambda column: abs(column - center))
+        self.nodes = 0
+
+    def clear(self):
+        self.table.clear()
+
+    def get_empty_cells(self, state):
+        return self.board_size - state.mask.bit_count()
+
+    def _negamax(self, player_mask, opponent_mask, moves, depth, alpha, beta):
+        self.nodes += 1
+        game = self.game
+        mask = player_mask | opponent_mask
+        if moves == self.board_size:
+            return 0, None
+
+        playable = []
+        for column in self.move_order:
+            if mask & game.top_masks[column]:
+                continue
+            move = (mask + game.bottom_masks[column]) & game.column_masks[column]
+            if game.has_alignment(player_mask | move):
+                return (self.board_size + 1 - moves) // 2, column
+            playable.append((column, move))
+        if depth == 0:
+            return 0, None
+
+        # No immediate win, so the best possible score is winning with our
+        # next stone after this one.
+        best_possible = (self.board_size - 1 - moves) // 2
+        if beta > best_possible:
+            beta = best_possible
+            if alpha >= beta:
+                return beta, None
+
+        key = player_mask + mask
+        original_alpha = alpha
+        entry = self.table.get(key)
+        best_move = None
+        if entry is not None:
+            entry_depth, flag, value, best_move = entry
+            if entry_depth >= depth:
+                if flag == EXACT:
+                    return value, best_move
+                if flag == LOWER_BOUND:
+                    alpha = max(alpha, value)
+                else:
+                    beta = min(beta, value)
+                if alpha >= beta:
+                    return value, best_move
+
+        if best_move is not None:
+            playable.sort(key=lambda item: item[0] != best_move)
+
+        best_score = -self.board_size
+        for column, move in playable:
+            score, _ = self._negamax(opponent_mask, player_mask | move, moves + 1, depth - 1, -beta, -alpha)
+            score = -score
+            if score > best_score:
+                best_score = score
+                best_move = column
+            if score > alpha:
+                alpha = score
+            if alpha >= beta:
+                break
+
+        if best_score <= original_alpha:
+            flag = UPPER_BOUND
+        elif best_score >= beta:
+            flag = LOWER_BOUND
+        else:
+            flag = EXACT
+        if len(self.table) >= self.table_size:
+            self.table.clear()
+        self.table[key] = (depth, flag, best_score, best_move)
+        return best_score, best_move
+
+    def solve(self, state, max_depth=None):
+        # Returns (score, best_move) for the player to move; only a full-depth
+        # search proves a draw.
+        empty_cells = self.get_empty_cells(state)
+        if max_depth is None:
+            max_depth = empty_cells
+        moves = self.board_size - empty_cells
+        score, best_move = 0, None
+        for depth in range(1, min(max_depth, empty_cells) + 1):
+            score, best_move = self._negamax(
+                state.player_mask, state.opponent_mask, moves, depth, -self.board_size, self.board_size
+            )
+            if score != 0:
+                break
+        return score, best_move
+
+    def get_value(self, state):
+        score, _ = self.solve(state)
+        return float(np.sign(score))
+
+    def get_action_probs(self, state):
+        _, best_move = self.solve(state)
+        action_probs = np.zeros(self.game.action_size)
+        action_probs[best_move] = 1
+        return action_probs
+
+def get_minimax_value(game, state):
+    # Plain minimax without pruning or a table, as a reference for Solver.
+    best_value = -1
+    for action in np.flatnonzero(game.get_valid_moves(state)):
+        next_state = game.get_next_state(state.copy(), action, 1)
+        value, is_terminal = game.get_value_and_terminated(next_state, action)
+        if not is_terminal:
+            value = -get_minimax_value(game, game.change_perspective(next_state, -1))
+        best_value = max(best_value, value)
+        if best_value == 1:
+            break
+    return best_value
+
+def get_random_endgame(game, empty_cells, rng):
+    num_plies = game.row_count * game.column_count - empty_cells
+    while True:
+        state, actions = game.get_random_playout(num_plies, rng)
+        if len(actions) == num_plies:
+            return state
+
+def check_solver(game, num_positions=150, max_empty_cells=10, seed=0):
+    # Compares the solver's value and best move with plain minimax on random
+    # endgames; returns the positions where they disagree.
+    rng = np.random.default_rng(seed)
+    solver = Solver(game)
+    mismatches = []
+    for _ in range(num_positions):
+        state = get_random_endgame(game, int(rng.integers(1, max_empty_cells + 1)), rng)
+        value = get_minimax_value(game, state)
+        score, best_move = solver.solve(state)
+        next_state = game.get_next_state(state.copy(), best_move, 1)
+        move_value, is_terminal = game.get_value_and_terminated(next_state, best_move)
+        if not is_terminal:
+            move_value = -get_minimax_value(game, game.change_perspective(next_state, -1))
+        if np.sign(score) != value or move_value != value:
+            mismatches.append((state, score, best_move, value))
+    return mismatches
+
+if __name__ == '__main__':
+    import ConnectFour_Logic
+    parser = argparse.ArgumentParser(description="Check the solver against plain minimax on random endgames.")
+    parser.add_argument("--positions", type=int, default=150)
+    parser.add_argument("--max-empty-cells", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=0)
+    options = parser.parse_args()
+
+    mismatches = check_solver(ConnectFour_Logic.ConnectFour(), options.positions, options.max_empty_cells, options.seed)
+    for state, score, best_move, value in mismatches:
+        print(f"MISMATCH {state}: solver score {score} move {best_move}, minimax value {value}")
+    if mismatches:
+        print(f"FAIL: {len(mismatches)}/{options.positions} positions disagree")
+        sys.exit(1)
+    print(f"PASS: {options.positions} positions agree")
@@ -0,0 +1,199 @@
+import numpy as np
+import torch
+import torch.nn.functional as F
+import argparse
+import glob
+import os
+import re
+import time
+import ConnectFour_Logic
+import ConnectFour_AlphaZero_agent
+import ConnectFour_SelfPlay
+
+# Trains the ResNet on self-play shards. The shards are only ever memory
+# mapped, so the replay window can be much larger than RAM; the loader
+# workers read whole batches of records at once and mirror the board
+# left-right at random, which is a symmetry of Connect Four.
+
+class ReplayBuffer(torch.utils.data.Dataset):
+    def __init__(self, game, directory, window_size):
+        self.game = game
+        self.directory = directory
+        self.window_size = window_size
+        self.dtype = ConnectFour_SelfPlay.get_sample_dtype(game)
+        self.refresh()
+
+    def refresh(self):
+        # Shards only appear once complete, so the buffer is append-only:
+        # keep the newest shards that fill the window.
+        paths = sorted(glob.glob(os.path.join(self.directory, "*.bin")), key=os.path.getmtime)
+        sizes = [os.path.getsize(path) // self.dtype.itemsize for path in paths]
+        total = 0
+        first = len(paths)
+        while first > 0 and total < self.window_size:
+            first -= 1
+            total += sizes[first]
+
+        self.paths = paths[first:]
+        self.ends = np.cumsum(sizes[first:], dtype=np.int64)
+        self.starts = self.ends - sizes[first:]
+        self.skip = max(total - self.window_size, 0)
+        self._shards = None
+
+    def __len__(self):
+        return int(self.ends[-1] - self.skip) if len(self.paths) > 0 else 0
+
+    def __getstate__(self):
+        # np.memmap pickles its whole contents; loader workers reopen the
+        # shards themselves instead.
+        state = self.__dict__.copy()
+        state['_shards'] = None
+        return state
+
+    def _get_shards(self):
+        if self._shards is None:
+            self._shards = [np.memmap(path, dtype=self.dtype, mode='r') for path in self.paths]
+        return self._shards
+
+    def __getitem__(self, indices):
+        shards = self._get_shards()
+        # Sorted indices keep reads within a shard in file order.
+        indices = np.sort(np.asarray(indices, dtype=np.int64)) + self.skip
+        shard_ids = np.searchsorted(self.ends, indices, side='right')
+        records = np.empty(len(indices), dtype=self.dtype)
+        for shard_id in np.unique(shard_ids):
+            selected = shard_ids == shard_id
+            records[selected] = shards[shard_id][indices[selected] - self.starts[shard_id]]
+
+        states = records['state'].astype(np.float32)
+        policies = records['policy'].copy()
+        mirror = (torch.rand(len(records)) < 0.5).numpy()
+        states[mirror] = states[mirror][..., ::-1]
+        policies[mirror] = policies[mirror][:, ::-1]
+        return (
+            torch.from_numpy(states),
+            torch.from_numpy(policies),
+            torch.from_numpy(np.ascontiguousarray(records['value'])).unsqueeze(1)
+        )
+
+def get_data_loader(buffer, batch_size, num_batches, num_workers, pin_memory=False):
+    # Sampling with replacement keeps memory flat however large the window
+    # is; a permutation of every index would not.
+    sampler = torch.utils.data.BatchSampler(
+        torch.utils.data.RandomSampler(buffer, replacement=True, num_samples=batch_size * num_batches),
+        batch_size,
+        drop_last=True
+    )
+    return torch.utils.data.DataLoader(
+        buffer,
+        sampler=sampler,
+        batch_size=None,
+        num_workers=num_workers,
+        pin_memory=pin_memory,
+        persistent_workers=False,
+        prefetch_factor=4 if num_workers > 0 else None
+    )
+
+class Trainer:
+    def __init__(self, model, optimizer, args):
+        self.model = model
+        self.optimizer = optimizer
+        self.args = args
+
+    def get_losses(self, batch):
+        # Returns (policy loss, value loss) for one batch from the loader.
+        states, policy_targets, value_targets = (tensor.to(self.model.device, non_blocking=True) for tensor in batch)
+        out_policy, out_value = self.model(states)
+        return F.cross_entropy(out_policy, policy_targets), F.mse_loss(out_value, value_targets)
+
+    def train(self, loader):
+        self.model.train()
+        policy_losses = []
+        value_losses = []
+        samples = 0
+        start_time = time.perf_counter()
+        for batch in loader:
+            policy_loss, value_loss = self.get_losses(batch)
+            loss = policy_loss + value_loss
+
+            self.optimizer.zero_grad()
+            loss.backward()
+            self.optimizer.step()
+
+            policy_losses.append(policy_loss.item())
+            value_losses.append(value_loss.item())
+            samples += len(batch[0])
+        self.model.eval()
+
+        elapsed = time.perf_counter() - start_time
+        return {
+            'policy_loss': float(np.mean(policy_losses)) if policy_losses else 0.0,
+            'value_loss': float(np.mean(value_losses)) if value_losses else 0.0,
+            'samples_per_sec': samples / elapsed if elapsed > 0 else 0.0
+        }
+
+    def save_checkpoint(self, directory, iteration):
+        # A plain state_dict, so AlphaZero can load it like ConnectFour_Weights.pt.
+        os.makedirs(directory, exist_ok=True)
+        weights_path = os.path.join(directory, f"ConnectFour_Weights_{iteration}.pt")
+        torch.save(self.model.state_dict(), weights_path)
+        torch.save(self.optimizer.state_dict(), os.path.join(directory, f"ConnectFour_Optimizer_{iteration}.pt"))
+        return weights_path
+
+def get_latest_checkpoint(directory):
+    # The highest iteration saved in directory, or None; a new run numbers
+    # its checkpoints after it instead of overwriting the earlier run.
+    iterations = []
+    for path in glob.glob(os.path.join(directory, "ConnectFour_Weights_*.pt")):
+        match = re.fullmatch(r"ConnectFour_Weights_(\d+)\.pt", os.path.basename(path))
+        if match is not None:
+            iterations.append(int(match.group(1)))
+    return max(iterations) if iterations else None
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Train the Connect Four ResNet on self-play shards.")
+    parser.add_argument("--data", default="./selfplay")
+    parser.add_argument("--weights", default=None, help="state_dict to start from (default: latest checkpoint in --output)")
+    parser.add_argument("--optimizer", default=None, help="optimizer state to resume from (default: latest checkpoint in --output)")
+    parser.add_argument("--output", default="./checkpoints")
+    parser.add_argument("--iterations", type=int, default=1)
+    parser.add_argument("--batches", type=int, default=1000, help="batches per iteration")
+    parser.add_argument("--batch-size", type=int, default=256)
+    parser.add_argument("--window", type=int, default=2**22, help="most recent samples to train on")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--lr", type=float, default=0.001)
+    parser.add_argument("--weight-decay", type=float, default=0.0001)
+    parser.add_argument("--device", default="cuda" if torch.cuda.is_available() else "cpu")
+    options = parser.parse_args()
+
+    game = ConnectFour_Logic.ConnectFour()
+    device = torch.device(options.device)
+    latest = get_latest_checkpoint(options.output)
+    if latest is not None and options.weights is None and options.optimizer is None:
+        options.weights = os.path.join(options.output, f"ConnectFour_Weights_{latest}.pt")
+        optimizer_path = os.path.join(options.output, f"ConnectFour_Optimizer_{latest}.pt")
+        if os.path.exists(optimizer_path):
+            options.optimizer = optimizer_path
+        print(f"resuming from {options.weights}")
+    first_iteration = latest + 1 if latest is not None else 0
+    if options.weights is not None:
+        model = ConnectFour_AlphaZero_agent.load_model(game, device=device, weights_path=options.weights)
+    else:
+        model = ConnectFour_AlphaZero_agent.ResNet(game, 9, 128, device)
+    optimizer = torch.optim.Adam(model.parameters(), lr=options.lr, weight_decay=options.weight_decay)
+    if options.optimizer is not None:
+        optimizer.load_state_dict(torch.load(options.optimizer, map_location=device, weights_only=True))
+    trainer = Trainer(model, optimizer, vars(options))
+
+    buffer = ReplayBuffer(game, options.data, options.window)
+    for iteration in range(first_iteration, first_iteration + options.iterations):
+        buffer.refresh()
+        if len(buffer) == 0:
+            raise SystemExit(f"No self-play shards found in {options.data}")
+        loader = get_data_loader(buffer, options.batch_size, options.batches, options.workers, device.type == "cuda")
+        stats = trainer.train(loader)
+        weights_path = trainer.save_checkpoint(options.output, iteration)
+        print(
+            f"iteration {iteration}: {len(buffer)} samples in window, policy loss {stats['policy_loss']:.4f}, "
+            f"value loss {stats['value_loss']:.4f}, {stats['samples_per_sec']:.0f} samples/sec -> {weights_path}"
+        )